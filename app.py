@@ -1,21 +1,43 @@
 """
 Main Flask application for Fruit Quality Scanner
 """
+# gevent must patch the standard library before Flask/requests are imported; only do it when
+# this module runs the server itself so importers (WSGI hosts, tests, scripts) keep the real stdlib
+monkey = None
+if __name__ == '__main__':
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        monkey = None
+
+import csv
+import io
+import logging
 import os
-import uuid
-from pathlib import Path
+import secrets
+import traceback
+from collections import Counter
+from functools import lru_cache
+from operator import itemgetter
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
-from werkzeug.utils import secure_filename
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 import json
+import numpy as np
 
 from config import (
-    UPLOAD_FOLDER, PROCESSED_FOLDER, MAX_UPLOAD_SIZE, ALLOWED_EXTENSIONS,
-    MODEL_PATH, DATA_YAML_PATH, CONFIDENCE_THRESHOLD, IOU_THRESHOLD,
+    UPLOAD_FOLDER_STR, PROCESSED_FOLDER_STR, MAX_UPLOAD_SIZE, ALLOWED_EXTENSIONS,
+    MODEL_PATH_STR, MODEL_PATH_EXISTS, DATA_YAML_PATH_STR, CONFIDENCE_THRESHOLD, IOU_THRESHOLD, YOLO_PRECISION,
     NIR_ENABLED, NIR_MOCK_MODE, NIR_DEVICE_ID, NIR_API_URL,
-    DATABASE_TYPE, DATABASE_URL
+    DATABASE_TYPE, DATABASE_URL, USE_X_SENDFILE, LOG_LEVEL
 )
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Import modules
 try:
     from models.yolo_detector import YOLODetector
@@ -30,10 +52,32 @@ except ImportError as e:
     create_nir_scanner = None
     DatabaseHandler = None
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson (C extension) with Flask's fallbacks for other types"""
+    
+    def dumps(self, obj, **kwargs):
+        # Match Flask's output: sorted keys, int keys allowed, and datetimes passed to
+        # Flask's default (HTTP date format) rather than orjson's ISO format
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+logging.basicConfig(level=LOG_LEVEL, format='%(message)s')
+
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
+if orjson:
+    app.json = OrjsonProvider(app)
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER_STR
 app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+
+# Single worker thread for model work when serving under gevent (set in __main__)
+inference_pool = None
 
 # Initialize components
 yolo_detector = None
@@ -46,8 +90,8 @@ def init_components():
     global yolo_detector, nir_scanner, fusion_engine, db_handler
     
     try:
-        if YOLODetector and MODEL_PATH.exists():
-            yolo_detector = YOLODetector(str(MODEL_PATH), str(DATA_YAML_PATH))
+        if YOLODetector and MODEL_PATH_EXISTS:
+            yolo_detector = YOLODetector(MODEL_PATH_STR, DATA_YAML_PATH_STR, precision=YOLO_PRECISION)
             print("YOLO detector initialized successfully")
     except Exception as e:
         print(f"Warning: Could not initialize YOLO detector: {e}")
@@ -77,10 +121,41 @@ def init_components():
     except Exception as e:
         print(f"Warning: Could not initialize database handler: {e}")
 
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Freshness score weights (YOLO 0.6, NIR 0.4), pre-scaled to a percentage
+YOLO_SCORE_WEIGHT = 0.6 * 100
+NIR_SCORE_WEIGHT = 0.4 * 100
+
+# Stored fruits are normalized by DatabaseHandler, so fields are read without .get fallbacks
+get_fruit_fields = itemgetter('type', 'ripeness', 'quality_status', 'confidence')
+get_yolo_confidence = itemgetter('yolo_confidence')
+get_nir_confidence = itemgetter('nir_confidence')
+
+def run_inference(func, *args):
+    """Run CPU/GPU-bound model work off the gevent hub so other requests keep being served"""
+    if inference_pool is None:
+        return func(*args)
+    return inference_pool.apply(func, args)
+
+@lru_cache(maxsize=512)
+def format_timestamp(ts: str) -> str:
+    """Format an ISO timestamp for display (cached per unique string)"""
+    if not ts:
+        return 'Unknown'
+    try:
+        dt = datetime.fromisoformat(ts)
+        return dt.strftime('%b %d, %Y • %I:%M %p')
+    except ValueError:
+        return ts
+
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    """Return the request's database session to the pool"""
+    if db_handler:
+        db_handler.remove_session()
+
+def file_extension(filename):
+    """Return the lowercased extension of a filename ('' if it has none)"""
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
 
 @app.route('/')
 def index():
@@ -91,45 +166,39 @@ def index():
 def history():
     """History page showing past scans"""
     history_entries = []
-    fruit_types = set()
+    fruit_types = []
     summary_stats = {
         'total_scans': 0,
         'total_fruits': 0,
         'latest_scan': None
     }
 
-    def format_timestamp(ts: str) -> str:
-        if not ts:
-            return 'Unknown'
-        try:
-            dt = datetime.fromisoformat(ts)
-            return dt.strftime('%b %d, %Y • %I:%M %p')
-        except ValueError:
-            return ts
-
     if db_handler:
         try:
-            scans = db_handler.get_all_scans(limit=50)
-            summary_stats['total_scans'] = len(scans)
-
-            for scan in scans:
-                scan_details = db_handler.get_scan(scan['scan_id'])
-                if not scan_details:
-                    continue
+            # Rollups come from the handler's cache; only the displayed rows are queried
+            summary = db_handler.get_summary()
+            summary_stats['total_scans'] = summary['total_scans']
+            summary_stats['total_fruits'] = summary['total_fruits']
+            if summary['latest_timestamp']:
+                summary_stats['latest_scan'] = format_timestamp(summary['latest_timestamp'])
+            fruit_types = summary['fruit_types']
 
+            scans = db_handler.get_scans_with_details(limit=50)
+            for scan_details in scans:
                 timestamp = scan_details.get('timestamp')
                 formatted_timestamp = format_timestamp(timestamp)
                 fruits = scan_details.get('fruits', [])
-                summary_stats['total_fruits'] += len(fruits)
-                if not summary_stats['latest_scan']:
-                    summary_stats['latest_scan'] = formatted_timestamp
 
-                for fruit in fruits:
-                    fruit_type = fruit.get('type', 'Unknown')
-                    ripeness = fruit.get('ripeness', 'Unknown')
-                    yolo_conf = fruit.get('yolo_confidence', fruit.get('confidence', 0)) or 0
-                    nir_conf = fruit.get('nir_confidence', 0) or 0
-                    freshness_score = (yolo_conf * 0.6 + nir_conf * 0.4) * 100
+                # Score the whole scan in one vector op instead of per fruit
+                fruit_count = len(fruits)
+                yolo_confs = np.fromiter(map(get_yolo_confidence, fruits), dtype=np.float64, count=fruit_count)
+                nir_confs = np.fromiter(map(get_nir_confidence, fruits), dtype=np.float64, count=fruit_count)
+                freshness_scores = yolo_confs * YOLO_SCORE_WEIGHT + nir_confs * NIR_SCORE_WEIGHT
+
+                for fruit, yolo_conf, nir_conf, freshness_score in zip(
+                    fruits, yolo_confs.tolist(), nir_confs.tolist(), freshness_scores.tolist()
+                ):
+                    fruit_type, ripeness, quality_status, confidence = get_fruit_fields(fruit)
 
                     entry = {
                         'scan_id': scan_details.get('scan_id'),
@@ -137,19 +206,17 @@ def history():
                         'raw_timestamp': timestamp,
                         'fruit_type': fruit_type,
                         'ripeness': ripeness,
-                        'quality_status': fruit.get('quality_status', 'Unknown'),
+                        'quality_status': quality_status,
                         'freshness_score': freshness_score,
                         'yolo_confidence': yolo_conf * 100,
                         'nir_confidence': nir_conf * 100,
-                        'confidence': (fruit.get('confidence', 0) or 0) * 100,
-                        'total_fruits': len(fruits),
+                        'confidence': confidence * 100,
+                        'total_fruits': fruit_count,
                         'status': 'Completed',
                         'processed_image_path': scan_details.get('processed_image_path')
                     }
 
                     history_entries.append(entry)
-                    if fruit_type:
-                        fruit_types.add(fruit_type)
         except Exception as e:
             print(f"Error loading history data: {e}")
 
@@ -191,9 +258,7 @@ def history():
         summary_stats['total_scans'] = len({entry['scan_id'] for entry in sample_entries})
         summary_stats['total_fruits'] = len(sample_entries)
         summary_stats['latest_scan'] = sample_entries[0]['timestamp']
-        fruit_types = {entry['fruit_type'] for entry in sample_entries}
-
-    fruit_types = sorted(list(fruit_types))
+        fruit_types = sorted({entry['fruit_type'] for entry in sample_entries})
 
     return render_template(
         'history.html',
@@ -202,32 +267,33 @@ def history():
         fruit_types=fruit_types
     )
 
-@app.route('/settings')
-def settings():
-    """Settings page showing configuration overview"""
-    detection_settings = {
-        'confidence_threshold': CONFIDENCE_THRESHOLD,
-        'iou_threshold': IOU_THRESHOLD,
-        'model_path': str(MODEL_PATH),
-        'data_yaml_path': str(DATA_YAML_PATH),
-        'max_upload_size_mb': round(MAX_UPLOAD_SIZE / (1024 * 1024), 1),
-        'allowed_extensions': ', '.join(sorted(ext.upper() for ext in ALLOWED_EXTENSIONS))
-    }
+# Settings page configuration is fixed at startup, so build it once
+DETECTION_SETTINGS = {
+    'confidence_threshold': CONFIDENCE_THRESHOLD,
+    'iou_threshold': IOU_THRESHOLD,
+    'model_path': MODEL_PATH_STR,
+    'data_yaml_path': DATA_YAML_PATH_STR,
+    'max_upload_size_mb': round(MAX_UPLOAD_SIZE / (1024 * 1024), 1),
+    'allowed_extensions': ', '.join(sorted(ext.upper() for ext in ALLOWED_EXTENSIONS))
+}
 
-    nir_settings = {
-        'enabled': NIR_ENABLED,
-        'mock_mode': NIR_MOCK_MODE,
-        'device_id': NIR_DEVICE_ID or 'Not configured',
-        'api_url': NIR_API_URL or 'Not configured'
-    }
+NIR_SETTINGS = {
+    'enabled': NIR_ENABLED,
+    'mock_mode': NIR_MOCK_MODE,
+    'device_id': NIR_DEVICE_ID or 'Not configured',
+    'api_url': NIR_API_URL or 'Not configured'
+}
 
-    storage_settings = {
-        'database_type': DATABASE_TYPE.title(),
-        'database_url': DATABASE_URL,
-        'upload_folder': str(UPLOAD_FOLDER),
-        'processed_folder': str(PROCESSED_FOLDER)
-    }
+STORAGE_SETTINGS = {
+    'database_type': DATABASE_TYPE.title(),
+    'database_url': DATABASE_URL,
+    'upload_folder': UPLOAD_FOLDER_STR,
+    'processed_folder': PROCESSED_FOLDER_STR
+}
 
+@app.route('/settings')
+def settings():
+    """Settings page showing configuration overview"""
     system_status = {
         'yolo_detector': 'Connected' if yolo_detector else 'Not Initialized',
         'nir_scanner': 'Connected' if nir_scanner else 'Not Available',
@@ -237,9 +303,9 @@ def settings():
 
     return render_template(
         'settings.html',
-        detection_settings=detection_settings,
-        nir_settings=nir_settings,
-        storage_settings=storage_settings,
+        detection_settings=DETECTION_SETTINGS,
+        nir_settings=NIR_SETTINGS,
+        storage_settings=STORAGE_SETTINGS,
         system_status=system_status
     )
 
@@ -253,36 +319,43 @@ def detect():
     if file.filename == '':
         return jsonify({'success': False, 'error': 'No file selected'}), 400
     
-    if not allowed_file(file.filename):
+    # Extension is computed once and reused for the saved filename; the client's
+    # filename is otherwise never used, so it needs no sanitizing
+    file_ext = file_extension(file.filename)
+    if file_ext not in ALLOWED_EXTENSIONS:
         return jsonify({'success': False, 'error': 'Invalid file type'}), 400
     
     try:
-        # Ensure upload directory exists
-        upload_dir = Path(app.config['UPLOAD_FOLDER'])
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
+        # Upload and processed directories are created once by config.py at import
         # Generate unique filename
-        scan_id = str(uuid.uuid4())
-        filename = secure_filename(file.filename)
-        file_ext = filename.rsplit('.', 1)[1].lower()
+        scan_id = secrets.token_hex(16)
         saved_filename = f"{scan_id}.{file_ext}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
+        filepath = os.path.join(UPLOAD_FOLDER_STR, saved_filename)
         
-        print(f"Saving uploaded file to: {filepath}")
-        file.save(filepath)
-        print(f"File saved successfully. Size: {os.path.getsize(filepath)} bytes")
+        # Read the upload once; the bytes are decoded in memory and archived as-is
+        image_bytes = file.read()
         
         # Process image
         if not yolo_detector:
             error_msg = 'YOLO detector not initialized. Please check if the model file exists.'
             print(f"ERROR: {error_msg}")
-            print(f"Model path: {MODEL_PATH}")
-            print(f"Model exists: {MODEL_PATH.exists()}")
+            print(f"Model path: {MODEL_PATH_STR}")
+            print(f"Model exists: {MODEL_PATH_EXISTS}")
             return jsonify({'success': False, 'error': error_msg}), 500
         
+        # Decode before saving so rejected uploads never leave files behind
+        image = run_inference(yolo_detector.decode_image, image_bytes)
+        if image is None:
+            return jsonify({'success': False, 'error': 'Could not decode image'}), 400
+        
+        print(f"Saving uploaded file to: {filepath}")
+        with open(filepath, 'wb') as upload_file:
+            upload_file.write(image_bytes)
+        print(f"File saved successfully. Size: {len(image_bytes)} bytes")
+        
         # Run YOLO detection
         print(f"Running YOLO detection on: {filepath}")
-        yolo_results = yolo_detector.detect(filepath)
+        yolo_results = run_inference(yolo_detector.detect_array, image)
         print(f"YOLO detection completed. Found {len(yolo_results)} fruits.")
         
         # Use fusion engine if available, otherwise use YOLO only
@@ -293,7 +366,6 @@ def detect():
                 results = fusion_engine.fuse_detections(yolo_results, filepath)
                 print(f"Fusion completed. {len(results)} fused results.")
             except Exception as e:
-                import traceback
                 print(f"Warning: Fusion failed, using YOLO only: {e}")
                 print(f"Fusion traceback:\n{traceback.format_exc()}")
                 results = yolo_results
@@ -301,15 +373,11 @@ def detect():
             print("Fusion engine not available, using YOLO only.")
             results = yolo_results
         
-        # Ensure processed directory exists
-        processed_dir = Path(PROCESSED_FOLDER)
-        processed_dir.mkdir(parents=True, exist_ok=True)
-        
         # Save processed image with annotations
         processed_filename = f"{scan_id}_processed.jpg"
-        processed_path = os.path.join(str(PROCESSED_FOLDER), processed_filename)
+        processed_path = os.path.join(PROCESSED_FOLDER_STR, processed_filename)
         print(f"Saving annotated image to: {processed_path}")
-        yolo_detector.save_annotated_image(filepath, processed_path, results)
+        run_inference(yolo_detector.save_annotated_array, image, processed_path, results)
         print("Annotated image saved successfully.")
         
         # Prepare results for database
@@ -323,11 +391,10 @@ def detect():
         }
         
         # Count fruits by type and include fusion details
-        fruit_counts = {}
-        for result in results:
-            # Use fruit_type (just fruit name) instead of class_name
-            fruit_type = result.get('fruit_type', result.get('class_name', 'Unknown'))
-            fruit_counts[fruit_type] = fruit_counts.get(fruit_type, 0) + 1
+        # Use fruit_type (just fruit name) instead of class_name
+        fruit_type_list = [result.get('fruit_type', result.get('class_name', 'Unknown')) for result in results]
+        fruit_counts = dict(Counter(fruit_type_list))
+        for result, fruit_type in zip(results, fruit_type_list):
             result_data['fruits'].append({
                 'type': fruit_type,  # Just the fruit name (e.g., "Pineapple", "Banana")
                 'confidence': result.get('confidence', 0),
@@ -357,7 +424,6 @@ def detect():
         })
     
     except Exception as e:
-        import traceback
         error_trace = traceback.format_exc()
         print(f"Error in detection: {e}")
         print(f"Full traceback:\n{error_trace}")
@@ -384,10 +450,17 @@ def results(scan_id):
                 fruits = results_data.get('fruits', [])
                 
                 # Calculate statistics based on quality_status/ripeness, not fruit type
+                # (single pass over the fruits)
                 total_fruits = len(fruits)
-                fresh_count = sum(1 for f in fruits if f.get('quality_status', '').lower() == 'fresh')
-                ripe_count = sum(1 for f in fruits if f.get('ripeness', '').lower() == 'ripe')
-                unripe_count = sum(1 for f in fruits if f.get('ripeness', '').lower() == 'unripe')
+                fresh_count = ripe_count = unripe_count = 0
+                for f in fruits:
+                    if f.get('quality_status', '').lower() == 'fresh':
+                        fresh_count += 1
+                    ripeness = f.get('ripeness', '').lower()
+                    if ripeness == 'ripe':
+                        ripe_count += 1
+                    elif ripeness == 'unripe':
+                        unripe_count += 1
                 
                 # Get processed image path
                 result_image = f"/static/images/processed/{scan_id}_processed.jpg"
@@ -426,27 +499,31 @@ def export_results(scan_id):
                 fruits = results_data.get('fruits', [])
                 
                 # Generate CSV
-                import csv
-                import io
-                
-                output = io.StringIO()
-                writer = csv.writer(output)
-                writer.writerow(['Fruit Type', 'Quality Status', 'Ripeness', 'Confidence (%)'])
-                
-                for fruit in fruits:
-                    writer.writerow([
-                        fruit.get('type', 'Unknown'),
-                        fruit.get('quality_status', 'Unknown'),
-                        fruit.get('ripeness', 'Unknown'),
-                        f"{fruit.get('confidence', 0) * 100:.1f}"
-                    ])
+                def generate_csv():
+                    # Reuse one small buffer so each row is sent as soon as it is written
+                    line = io.StringIO()
+                    writer = csv.writer(line)
+                    
+                    def csv_line(row):
+                        writer.writerow(row)
+                        value = line.getvalue()
+                        line.seek(0)
+                        line.truncate(0)
+                        return value
+                    
+                    yield csv_line(['Fruit Type', 'Quality Status', 'Ripeness', 'Confidence (%)'])
+                    for fruit in fruits:
+                        yield csv_line([
+                            fruit.get('type', 'Unknown'),
+                            fruit.get('quality_status', 'Unknown'),
+                            fruit.get('ripeness', 'Unknown'),
+                            f"{(fruit.get('confidence', 0) or 0) * 100:.1f}"
+                        ])
                 
-                output.seek(0)
-                return send_file(
-                    io.BytesIO(output.getvalue().encode()),
+                return Response(
+                    generate_csv(),
                     mimetype='text/csv',
-                    as_attachment=True,
-                    download_name=f'fruit_scan_{scan_id}.csv'
+                    headers={'Content-Disposition': f'attachment; filename=fruit_scan_{scan_id}.csv'}
                 )
         
         return jsonify({'error': 'Results not found'}), 404
@@ -483,5 +560,16 @@ if __name__ == '__main__':
     print(f"Starting Flask server on {HOST}:{PORT}")
     print(f"Debug mode: {DEBUG}")
     print(f"Access the application at: http://localhost:{PORT}\n")
-    app.run(host=HOST, port=PORT, debug=DEBUG)
+    if monkey:
+        # Cooperative server: concurrent uploads overlap while waiting on I/O. Inference runs on
+        # one real thread (the model is not thread-safe) so it never blocks the hub
+        from gevent.pywsgi import WSGIServer
+        from gevent.threadpool import ThreadPool
+        inference_pool = ThreadPool(1)
+        print("Serving with gevent WSGIServer")
+        app.debug = DEBUG
+        WSGIServer((HOST, PORT), app).serve_forever()
+    else:
+        print("gevent not installed, falling back to the Flask development server")
+        app.run(host=HOST, port=PORT, debug=DEBUG)
 
@@ -16,12 +16,18 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'  # Enable debug by default
 HOST = os.getenv('HOST', '0.0.0.0')
 PORT = int(os.getenv('PORT', 5000))
+# Let a front-end web server (Apache mod_xsendfile, lighttpd) deliver files Flask sends
+USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'False').lower() == 'true'
+# Level for log messages from the logging module (WARNING hides per-scan messages)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
 
 # Upload configuration
 UPLOAD_FOLDER = BASE_DIR / 'static' / 'images' / 'uploads'
 PROCESSED_FOLDER = BASE_DIR / 'static' / 'images' / 'processed'
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'bmp'})
+UPLOAD_FOLDER_STR = str(UPLOAD_FOLDER)
+PROCESSED_FOLDER_STR = str(PROCESSED_FOLDER)
 
 # YOLO model configuration
 # Using the trained model from data/models/yolov5n/runs folder
@@ -29,6 +35,12 @@ MODEL_PATH = BASE_DIR / 'data' / 'models' / 'yolov5n' / 'runs' / 'train' / 'yolo
 DATA_YAML_PATH = BASE_DIR / 'data' / 'datasets' / 'Fruit_dataset' / 'data.yaml'
 CONFIDENCE_THRESHOLD = float(os.getenv('YOLO_CONFIDENCE', 0.25))
 IOU_THRESHOLD = float(os.getenv('YOLO_IOU', 0.45))
+# Inference precision: fp32 runs the .pt model, fp16/int8 export a TensorRT engine (NVIDIA GPU)
+# or an OpenVINO model (CPU)
+YOLO_PRECISION = os.getenv('YOLO_PRECISION', 'fp32').lower()
+MODEL_PATH_STR = str(MODEL_PATH)
+MODEL_PATH_EXISTS = MODEL_PATH.exists()  # Checked once at startup
+DATA_YAML_PATH_STR = str(DATA_YAML_PATH)
 
 # NIR scanner configuration
 NIR_ENABLED = os.getenv('NIR_ENABLED', 'True').lower() == 'true'
@@ -56,6 +68,10 @@ MYSQL_DB = os.getenv('MYSQL_DB', 'fruit_scanner')
 MYSQL_USER = os.getenv('MYSQL_USER', 'root')
 MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', '')
 
+# Connection pool configuration (PostgreSQL/MySQL)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+
 # Database URL construction
 if DATABASE_TYPE == 'postgresql':
     DATABASE_URL = f'postgresql://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}@{POSTGRESQL_HOST}:{POSTGRESQL_PORT}/{POSTGRESQL_DB}'
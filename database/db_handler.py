@@ -2,14 +2,25 @@
 Database handler for Fruit Quality Scanner
 Supports SQLite, PostgreSQL, and MySQL
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import create_engine, event, func, select, delete, bindparam, Column, Index, Integer, String, Float, DateTime, Text, ForeignKey, JSON
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, joinedload
+from contextlib import contextmanager
+from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional
 import json
+import logging
 
-from config import DATABASE_URL, DATABASE_TYPE
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from config import DATABASE_URL, DATABASE_TYPE, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -18,7 +29,7 @@ class Scan(Base):
     """Scan table - stores scan metadata"""
     __tablename__ = 'scans'
     
-    id = Column(String, primary_key=True)  # scan_id (UUID)
+    id = Column(String, primary_key=True)  # scan_id (32-char hex token)
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
     image_path = Column(String, nullable=False)
     processed_image_path = Column(String)
@@ -27,7 +38,13 @@ class Scan(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationship to fruits
-    fruits = relationship("Fruit", back_populates="scan", cascade="all, delete-orphan")
+    # passive_deletes leaves removing a deleted scan's fruits to the database instead of loading them
+    fruits = relationship("Fruit", back_populates="scan", cascade="all, delete-orphan",
+                          order_by="Fruit.id", passive_deletes=True)
+    
+    # History lists newest scans first; including id makes the paginated
+    # ORDER BY timestamp DESC ... LIMIT an index-only scan
+    __table_args__ = (Index('ix_scans_ts_id', timestamp.desc(), id),)
 
 
 class Fruit(Base):
@@ -35,30 +52,51 @@ class Fruit(Base):
     __tablename__ = 'fruits'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    scan_id = Column(String, ForeignKey('scans.id'), nullable=False)
-    fruit_type = Column(String, nullable=False)
-    class_id = Column(Integer)
-    class_name = Column(String)
-    quality_status = Column(String)
+    scan_id = Column(String, ForeignKey('scans.id', ondelete='CASCADE'), nullable=False)
+    fruit_type = Column(String, nullable=False, index=True)
+    quality_status = Column(String, index=True)
     ripeness = Column(String)
     confidence = Column(Float)
     yolo_confidence = Column(Float)
     nir_confidence = Column(Float)
-    bbox_x1 = Column(Float)
-    bbox_y1 = Column(Float)
-    bbox_x2 = Column(Float)
-    bbox_y2 = Column(Float)
-    nir_quality_score = Column(Float)
-    fusion_method = Column(String)
+    # bbox, class_id and nir_quality_score are read from Scan.results_json
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationship to scan
     scan = relationship("Scan", back_populates="fruits")
+    
+    # Fruits are always looked up by their scan
+    __table_args__ = (Index('idx_fruits_scan', scan_id),)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL journaling so readers are not blocked while a scan is being saved"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    # Keep sort/group temp tables in RAM and memory-map up to 256 MB of the file
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.close()
+
+
+def _compact_json_dumps(obj) -> str:
+    """Serialize JSON columns without the default separator whitespace (with orjson when installed)"""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, separators=(',', ':'))
+
+
+# Parse JSON columns with orjson when installed
+_json_loads = orjson.loads if orjson else json.loads
 
 
 class DatabaseHandler:
     """Handler for database operations"""
     
+    # Number of scans kept in the per-process get_scan cache
+    SCAN_CACHE_SIZE = 128
+    
     def __init__(self, database_url: Optional[str] = None):
         """
         Initialize database handler
@@ -75,31 +113,108 @@ class DatabaseHandler:
             self.engine = create_engine(
                 self.database_url,
                 connect_args={'check_same_thread': False},
+                json_serializer=_compact_json_dumps,
+                json_deserializer=_json_loads,
                 echo=False
             )
+            event.listen(self.engine, 'connect', _set_sqlite_pragmas)
         else:
-            self.engine = create_engine(self.database_url, echo=False)
+            # Pooled connections, validated before use so stale ones are recycled
+            self.engine = create_engine(
+                self.database_url,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                isolation_level='READ COMMITTED',
+                json_serializer=_compact_json_dumps,
+                json_deserializer=_json_loads,
+                echo=False
+            )
         
-        # Create session factory
-        SessionLocal = sessionmaker(bind=self.engine)
-        self.SessionLocal = SessionLocal
+        # Create thread-local session registry (released per request via remove_session)
+        self.SessionLocal = scoped_session(sessionmaker(bind=self.engine))
         
-        # Create tables
+        # Create tables (and indexes missing from databases created before they were added)
         Base.metadata.create_all(self.engine)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
+        
+        # Bumped on every write so cached reads never outlive the data they came from
+        self._data_version = 0
+        self._get_scan_cached = lru_cache(maxsize=self.SCAN_CACHE_SIZE)(self._load_scan)
+        self._summary_cache = None  # (data version, summary dict)
         
-        print(f"Database handler initialized ({self.database_type})")
+        # Built once so every get_scan reuses the same compiled SQL (scan and fruits in one round trip)
+        self._get_scan_stmt = (
+            select(Scan)
+            .options(joinedload(Scan.fruits))
+            .where(Scan.id == bindparam('scan_id'))
+        )
+        
+        logger.info("Database handler initialized (%s)", self.database_type)
     
     def get_session(self):
-        """Get database session"""
+        """Get the current thread's database session (shared by every call until remove_session)"""
         return self.SessionLocal()
     
+    def remove_session(self) -> None:
+        """Release the current thread's session back to the pool"""
+        self.SessionLocal.remove()
+    
+    @contextmanager
+    def _session_scope(self):
+        """Run a block in one transaction: commit on success, roll back on error"""
+        session = self.get_session()
+        # End the read transaction left open by earlier calls in this request
+        if session.in_transaction():
+            session.commit()
+        with session.begin():
+            yield session
+    
+    @staticmethod
+    def _scan_to_dict(scan: Scan, fruits: List[Fruit]) -> Dict:
+        """Build the scan dictionary shape returned by get_scan (every fruit key is always present)"""
+        results_json = scan.results_json or {}
+        
+        # Detection details live in results_json; match them to fruits by class name (first match wins)
+        results_by_type = {}
+        for r in results_json.get('results', []):
+            results_by_type.setdefault(r.get('class_name'), r)
+        
+        fruit_dicts = []
+        for f in fruits:
+            result = results_by_type.get(f.fruit_type, {})
+            bbox = list(result.get('bbox') or [])[:4]
+            fruit_dicts.append({
+                'type': f.fruit_type,
+                'class_id': result.get('class_id'),
+                'quality_status': f.quality_status,
+                'ripeness': f.ripeness,
+                'confidence': f.confidence or 0.0,
+                'yolo_confidence': f.yolo_confidence or 0.0,
+                'nir_confidence': f.nir_confidence or 0.0,
+                'bbox': bbox + [0] * (4 - len(bbox)),
+                'nir_quality_score': result.get('nir_quality_score')
+            })
+        
+        return {
+            'scan_id': scan.id,
+            'timestamp': scan.timestamp.isoformat() if scan.timestamp else None,
+            'image_path': scan.image_path,
+            'processed_image_path': scan.processed_image_path,
+            'total_fruits': scan.total_fruits,
+            'results': results_json,
+            'fruits': fruit_dicts
+        }
+    
     def save_scan(self, scan_id: str, image_path: str, processed_image_path: str, 
                   results_data: Dict) -> bool:
         """
         Save scan results to database
         
         Args:
-            scan_id: Unique scan ID (UUID)
+            scan_id: Unique scan ID (hex token)
             image_path: Path to original image
             processed_image_path: Path to processed/annotated image
             results_data: Dictionary with scan results
@@ -108,68 +223,70 @@ class DatabaseHandler:
             True if successful, False otherwise
         """
         try:
-            session = self.get_session()
-            
             # Extract data
             results = results_data.get('results', [])
             total_fruits = results_data.get('total_fruits', len(results))
+            fruits_data = results_data.get('fruits', [])
             
-            # Create scan record
-            scan = Scan(
-                id=scan_id,
-                timestamp=datetime.utcnow(),
-                image_path=image_path,
-                processed_image_path=processed_image_path,
-                results_json=results_data,
-                total_fruits=total_fruits
-            )
-            
-            session.add(scan)
+            # Index results by class name once (first match wins, as before)
+            results_by_type = {}
+            for r in results:
+                results_by_type.setdefault(r.get('class_name'), r)
             
-            # Create fruit records
-            fruits_data = results_data.get('fruits', [])
+            # Only the columns that are filtered, grouped or aggregated on are written per fruit;
+            # the full detection dict is already stored once in results_json
+            fruit_rows = []
+            no_result = {}
             for fruit_data in fruits_data:
-                # Get corresponding result for bbox
-                result = next((r for r in results if r.get('class_name') == fruit_data.get('type')), {})
-                bbox = result.get('bbox', [0, 0, 0, 0])
+                get = fruit_data.get
+                fruit_type = get('type')
+                result_get = results_by_type.get(fruit_type, no_result).get
                 
-                fruit = Fruit(
-                    scan_id=scan_id,
-                    fruit_type=fruit_data.get('type', 'Unknown'),
-                    class_id=result.get('class_id'),
-                    class_name=fruit_data.get('type', 'Unknown'),
-                    quality_status=fruit_data.get('quality_status', 'unknown'),
-                    ripeness=fruit_data.get('ripeness', 'Unknown'),
-                    confidence=fruit_data.get('confidence', 0.0),
-                    yolo_confidence=result.get('yolo_confidence', fruit_data.get('confidence', 0.0)),
-                    nir_confidence=result.get('nir_confidence', 0.0),
-                    bbox_x1=bbox[0] if len(bbox) > 0 else 0,
-                    bbox_y1=bbox[1] if len(bbox) > 1 else 0,
-                    bbox_x2=bbox[2] if len(bbox) > 2 else 0,
-                    bbox_y2=bbox[3] if len(bbox) > 3 else 0,
-                    nir_quality_score=result.get('nir_quality_score'),
-                    fusion_method=result.get('fusion_method', 'yolo_only')
-                )
+                # Normalize at write time so readers can rely on every field being set
+                confidence = get('confidence') or 0.0
+                fruit_rows.append({
+                    'scan_id': scan_id,
+                    'fruit_type': fruit_type or 'Unknown',
+                    'quality_status': get('quality_status') or 'unknown',
+                    'ripeness': get('ripeness') or 'Unknown',
+                    'confidence': confidence,
+                    'yolo_confidence': result_get('yolo_confidence', confidence) or 0.0,
+                    'nir_confidence': result_get('nir_confidence') or 0.0
+                })
+            
+            # Scan and fruits are written in a single transaction (one commit/fsync per scan)
+            with self._session_scope() as session:
+                session.add(Scan(
+                    id=scan_id,
+                    timestamp=datetime.utcnow(),
+                    image_path=image_path,
+                    processed_image_path=processed_image_path,
+                    results_json=results_data,
+                    total_fruits=total_fruits
+                ))
+                # Write the scan row first so the fruit rows' foreign key resolves
+                session.flush()
                 
-                session.add(fruit)
+                # Create fruit records with one executemany instead of an ORM object per fruit
+                if fruit_rows:
+                    session.bulk_insert_mappings(Fruit, fruit_rows)
             
-            session.commit()
-            session.close()
+            self._data_version += 1
             
-            print(f"Scan {scan_id} saved to database")
+            logger.info("Scan %s saved to database", scan_id)
             return True
         
         except Exception as e:
-            print(f"Error saving scan to database: {e}")
-            if 'session' in locals():
-                session.rollback()
-                session.close()
+            logger.error("Error saving scan to database: %s", e)
             return False
     
     def get_scan(self, scan_id: str) -> Optional[Dict]:
         """
         Get scan data from database
         
+        Results are cached per scan ID until the next save or delete; callers get a
+        copy, so mutating it never touches the cache.
+        
         Args:
             scan_id: Scan ID to retrieve
         
@@ -177,84 +294,158 @@ class DatabaseHandler:
             Dictionary with scan data, or None if not found
         """
         try:
-            session = self.get_session()
-            
-            scan = session.query(Scan).filter(Scan.id == scan_id).first()
+            return deepcopy(self._get_scan_cached(scan_id, self._data_version))
+        
+        except Exception as e:
+            logger.error("Error getting scan from database: %s", e)
+            return None
+    
+    def _load_scan(self, scan_id: str, version: int) -> Optional[Dict]:
+        """
+        Query a scan and its fruits for the get_scan cache
+        
+        version only partitions the cache; errors propagate so they are never cached.
+        """
+        session = self.get_session()
+        try:
+            scan = session.execute(self._get_scan_stmt, {'scan_id': scan_id}).unique().scalar_one_or_none()
             
             if not scan:
-                session.close()
                 return None
             
-            # Get fruits
-            fruits = session.query(Fruit).filter(Fruit.scan_id == scan_id).all()
+            return self._scan_to_dict(scan, scan.fruits)
+        except Exception:
+            session.rollback()
+            raise
+    
+    def get_all_scans(self, limit: int = 100, offset: int = 0) -> List[Dict]:
+        """
+        Get all scans with pagination
+        
+        Args:
+            limit: Maximum number of scans to return
+            offset: Number of scans to skip
+        
+        Returns:
+            List of scan dictionaries
+        """
+        try:
+            session = self.get_session()
             
-            # Build result dictionary
-            result = {
-                'scan_id': scan.id,
-                'timestamp': scan.timestamp.isoformat() if scan.timestamp else None,
-                'image_path': scan.image_path,
-                'processed_image_path': scan.processed_image_path,
-                'total_fruits': scan.total_fruits,
-                'results': scan.results_json or {},
-                'fruits': [
-                    {
-                        'type': f.fruit_type,
-                        'class_id': f.class_id,
-                        'quality_status': f.quality_status,
-                        'ripeness': f.ripeness,
-                        'confidence': f.confidence,
-                        'yolo_confidence': f.yolo_confidence,
-                        'nir_confidence': f.nir_confidence,
-                        'bbox': [f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2],
-                        'nir_quality_score': f.nir_quality_score
-                    }
-                    for f in fruits
-                ]
-            }
+            # Select only the listed columns as plain rows instead of loading Scan objects
+            stmt = (
+                select(Scan.id, Scan.timestamp, Scan.total_fruits, Scan.image_path)
+                .order_by(Scan.timestamp.desc())
+                .limit(limit)
+                .offset(offset)
+            )
             
-            session.close()
-            return result
+            return [
+                {
+                    'scan_id': scan_id,
+                    'timestamp': timestamp.isoformat() if timestamp else None,
+                    'total_fruits': total_fruits,
+                    'image_path': image_path
+                }
+                for scan_id, timestamp, total_fruits, image_path in session.execute(stmt)
+            ]
         
         except Exception as e:
-            print(f"Error getting scan from database: {e}")
+            logger.error("Error getting scans from database: %s", e)
             if 'session' in locals():
-                session.close()
-            return None
+                session.rollback()
+            return []
     
-    def get_all_scans(self, limit: int = 100, offset: int = 0) -> List[Dict]:
+    def get_scans_with_details(self, limit: int = 100, offset: int = 0) -> List[Dict]:
         """
-        Get all scans with pagination
+        Get the most recent scans together with their fruits in a single query
         
         Args:
             limit: Maximum number of scans to return
             offset: Number of scans to skip
         
         Returns:
-            List of scan dictionaries
+            List of scan dictionaries in the same shape as get_scan, newest first
         """
         try:
             session = self.get_session()
             
-            scans = session.query(Scan).order_by(Scan.timestamp.desc()).limit(limit).offset(offset).all()
+            # Limit on scans (not on joined rows) so every scan keeps all of its fruits
+            recent_ids = (
+                session.query(Scan.id)
+                .order_by(Scan.timestamp.desc())
+                .limit(limit)
+                .offset(offset)
+                .subquery()
+            )
+            rows = (
+                session.query(Scan, Fruit)
+                .outerjoin(Fruit, Fruit.scan_id == Scan.id)
+                .filter(Scan.id.in_(session.query(recent_ids.c.id)))
+                .order_by(Scan.timestamp.desc(), Fruit.id)
+                .all()
+            )
             
-            results = []
-            for scan in scans:
-                results.append({
-                    'scan_id': scan.id,
-                    'timestamp': scan.timestamp.isoformat() if scan.timestamp else None,
-                    'total_fruits': scan.total_fruits,
-                    'image_path': scan.image_path
-                })
+            # Group joined rows by scan, preserving timestamp order
+            grouped = {}
+            for scan, fruit in rows:
+                scan_fruits = grouped.setdefault(scan.id, (scan, []))[1]
+                if fruit is not None:
+                    scan_fruits.append(fruit)
             
-            session.close()
+            results = [self._scan_to_dict(scan, fruits) for scan, fruits in grouped.values()]
             return results
         
         except Exception as e:
-            print(f"Error getting scans from database: {e}")
+            logger.error("Error getting scans from database: %s", e)
             if 'session' in locals():
-                session.close()
+                session.rollback()
             return []
     
+    def get_summary(self) -> Dict:
+        """
+        Get history rollups across all scans
+        
+        The result is cached until the next save or delete; callers get a copy.
+        
+        Returns:
+            Dictionary with total_scans, total_fruits, latest_timestamp (ISO string or None)
+            and fruit_types (sorted list of distinct fruit types)
+        """
+        cached = self._summary_cache
+        if cached and cached[0] == self._data_version:
+            return deepcopy(cached[1])
+        
+        version = self._data_version
+        try:
+            session = self.get_session()
+            
+            total_scans, latest_timestamp = session.query(func.count(Scan.id), func.max(Scan.timestamp)).one()
+            total_fruits = session.query(func.count(Fruit.id)).scalar()
+            fruit_types = sorted(
+                fruit_type for (fruit_type,) in session.query(Fruit.fruit_type).distinct() if fruit_type
+            )
+            
+            summary = {
+                'total_scans': total_scans,
+                'total_fruits': total_fruits,
+                'latest_timestamp': latest_timestamp.isoformat() if latest_timestamp else None,
+                'fruit_types': fruit_types
+            }
+            self._summary_cache = (version, summary)
+            return deepcopy(summary)
+        
+        except Exception as e:
+            logger.error("Error getting summary from database: %s", e)
+            if 'session' in locals():
+                session.rollback()
+            return {
+                'total_scans': 0,
+                'total_fruits': 0,
+                'latest_timestamp': None,
+                'fruit_types': []
+            }
+    
     def delete_scan(self, scan_id: str) -> bool:
         """
         Delete scan from database
@@ -266,24 +457,21 @@ class DatabaseHandler:
             True if successful, False otherwise
         """
         try:
-            session = self.get_session()
+            # Set-based DELETEs without loading the scan or its fruits; fruits are deleted explicitly
+            # because older databases lack ON DELETE CASCADE and SQLite leaves foreign keys unenforced
+            with self._session_scope() as session:
+                session.execute(delete(Fruit).where(Fruit.scan_id == scan_id))
+                deleted = session.execute(delete(Scan).where(Scan.id == scan_id)).rowcount
             
-            scan = session.query(Scan).filter(Scan.id == scan_id).first()
-            if scan:
-                session.delete(scan)
-                session.commit()
-                session.close()
-                print(f"Scan {scan_id} deleted from database")
-                return True
-            else:
-                session.close()
+            if not deleted:
                 return False
+            
+            self._data_version += 1
+            logger.info("Scan %s deleted from database", scan_id)
+            return True
         
         except Exception as e:
-            print(f"Error deleting scan from database: {e}")
-            if 'session' in locals():
-                session.rollback()
-                session.close()
+            logger.error("Error deleting scan from database: %s", e)
             return False
     
     def get_statistics(self) -> Dict:
@@ -300,22 +488,14 @@ class DatabaseHandler:
             total_fruits = session.query(Fruit).count()
             
             # Count by fruit type
-            fruit_types = session.query(Fruit.fruit_type, session.query(Fruit).filter(
-                Fruit.fruit_type == Fruit.fruit_type
-            ).count()).distinct().all()
-            
-            type_counts = {}
-            for fruit_type, count in fruit_types:
-                type_counts[fruit_type] = count
+            type_counts = dict(
+                session.query(Fruit.fruit_type, func.count(Fruit.id)).group_by(Fruit.fruit_type).all()
+            )
             
             # Count by quality status
-            quality_counts = {}
-            quality_statuses = session.query(Fruit.quality_status).distinct().all()
-            for (status,) in quality_statuses:
-                count = session.query(Fruit).filter(Fruit.quality_status == status).count()
-                quality_counts[status] = count
-            
-            session.close()
+            quality_counts = dict(
+                session.query(Fruit.quality_status, func.count(Fruit.id)).group_by(Fruit.quality_status).all()
+            )
             
             return {
                 'total_scans': total_scans,
@@ -325,9 +505,9 @@ class DatabaseHandler:
             }
         
         except Exception as e:
-            print(f"Error getting statistics from database: {e}")
+            logger.error("Error getting statistics from database: %s", e)
             if 'session' in locals():
-                session.close()
+                session.rollback()
             return {
                 'total_scans': 0,
                 'total_fruits': 0,
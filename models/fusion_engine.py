@@ -1,15 +1,112 @@
 """
 Fusion Engine for combining YOLO detection and NIR analysis
 """
-from typing import List, Dict, Optional
+import logging
+import re
+from bisect import bisect_right
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 from models.yolo_detector import YOLODetector
 from nir.nir_scanner import NIRScannerBase
 
+try:
+    import gevent
+except ImportError:
+    gevent = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+logger = logging.getLogger(__name__)
+
+# Ripeness keywords and the category each one maps to; longer keywords come first
+# so 'overripe' / 'unripe' are never matched as plain 'ripe'
+_RIPENESS_RE = re.compile(r'unripe|underripe|half[- ]ripe|overripe|over-ripe|ripe')
+_RIPENESS_KEYWORD_CATEGORY = {
+    'unripe': 'unripe',
+    'underripe': 'unripe',
+    'half-ripe': 'half-ripe',
+    'half ripe': 'half-ripe',
+    'overripe': 'overripe',
+    'over-ripe': 'overripe',
+    'ripe': 'ripe',
+}
+# When a label mentions several categories, the first one listed here wins
+_RIPENESS_PRIORITY = ('unripe', 'half-ripe', 'overripe', 'ripe')
+# Position of each category on the ripening scale (adjacent categories count as agreement)
+_RIPENESS_ORDER = {'unripe': 0, 'half-ripe': 1, 'ripe': 2, 'overripe': 3}
+
+# Quality statuses from worst to best; a score at or above the i-th threshold ranks above status i
+_QUALITY_STATUSES = ('overripe', 'unripe', 'ripe', 'fresh')
+_NIR_QUALITY_THRESHOLDS = (0.4, 0.6, 0.8)
+_COMBINED_QUALITY_THRESHOLDS = (0.35, 0.55, 0.75)
+# Score given to a YOLO quality status in the weighted decision (anything else scores 0.4)
+_YOLO_QUALITY_SCORES = {'fresh': 0.8, 'ripe': 0.6}
+# Array forms of the tables above for the batch kernel
+_QUALITY_INDEX = {status: i for i, status in enumerate(_QUALITY_STATUSES)}
+_NIR_QUALITY_THRESHOLD_ARRAY = np.array(_NIR_QUALITY_THRESHOLDS)
+_COMBINED_QUALITY_THRESHOLD_ARRAY = np.array(_COMBINED_QUALITY_THRESHOLDS)
+
+
+def _ripeness_category(ripeness: str) -> Optional[str]:
+    """Map a lowercase ripeness label to unripe / half-ripe / ripe / overripe (None if unrecognized)"""
+    found = {_RIPENESS_KEYWORD_CATEGORY[kw] for kw in _RIPENESS_RE.findall(ripeness)}
+    for category in _RIPENESS_PRIORITY:
+        if category in found:
+            return category
+    return None
+
+
+def _ripeness_category_indices(labels: List[str]) -> np.ndarray:
+    """Vectorized _ripeness_category: position of each label on the ripening scale (-1 if unrecognized)"""
+    lowered = np.char.lower(np.array(labels, dtype=str))
+    
+    conditions = []
+    for category in _RIPENESS_PRIORITY:
+        mask = np.zeros(lowered.shape, dtype=bool)
+        for keyword, keyword_category in _RIPENESS_KEYWORD_CATEGORY.items():
+            if keyword_category == category:
+                mask |= np.char.find(lowered, keyword) >= 0
+        conditions.append(mask)
+    
+    # np.select takes the first matching condition, which preserves the category priority
+    return np.select(conditions, [_RIPENESS_ORDER[c] for c in _RIPENESS_PRIORITY], default=-1)
+
+
+def _fuse_scores(yolo_conf, nir_conf, agreement, yolo_quality_idx, yolo_quality_score, nir_quality_score,
+                 yolo_weight, nir_weight):
+    """
+    Numeric core of _fuse_single_detection over a batch of detections
+    
+    Returns:
+        Tuple of (overall confidence, ripeness confidence, index into _QUALITY_STATUSES) arrays
+    """
+    mean_conf = (yolo_conf + nir_conf) / 2
+    ripeness_conf = np.where(agreement, np.minimum(1.0, mean_conf + 0.1), mean_conf)
+    overall_conf = yolo_conf * yolo_weight + nir_conf * nir_weight
+    
+    # Keep YOLO's status where NIR's score maps to the same one, otherwise use the weighted score
+    nir_quality_idx = np.searchsorted(_NIR_QUALITY_THRESHOLD_ARRAY, nir_quality_score, side='right')
+    combined_score = nir_quality_score * nir_weight + yolo_quality_score * yolo_weight
+    combined_idx = np.searchsorted(_COMBINED_QUALITY_THRESHOLD_ARRAY, combined_score, side='right')
+    quality_idx = np.where(yolo_quality_idx == nir_quality_idx, yolo_quality_idx, combined_idx)
+    
+    return overall_conf, ripeness_conf, quality_idx
+
+
+# Compile the kernel when Numba is installed (it runs as plain NumPy otherwise)
+if njit is not None:
+    _fuse_scores = njit(cache=True)(_fuse_scores)
+
 
 class FusionEngine:
     """Engine to fuse YOLO detection and NIR analysis results"""
     
+    # From this many detections on, agreement and scores are computed for the whole batch at once
+    BATCH_FUSION_MIN_DETECTIONS = 50
+    
     def __init__(self, yolo_detector: YOLODetector, nir_scanner: NIRScannerBase):
         """
         Initialize fusion engine
@@ -20,12 +117,13 @@ class FusionEngine:
         """
         self.yolo_detector = yolo_detector
         self.nir_scanner = nir_scanner
+        self._nir_enabled = bool(getattr(nir_scanner, 'enabled', True))
         
         # Fusion weights (YOLO: 0.6, Felix/NIR: 0.4 as per conceptual framework)
         self.yolo_weight = 0.6  # Weight for YOLO detection
         self.nir_weight = 0.4   # Weight for Felix/NIR analysis
         
-        print("Fusion Engine initialized")
+        logger.info("Fusion Engine initialized")
     
     def fuse_detections(self, yolo_results: List[Dict], image_path: str) -> List[Dict]:
         """
@@ -38,40 +136,116 @@ class FusionEngine:
         Returns:
             List of fused detection results with enhanced quality assessment
         """
-        fused_results = []
-        
-        for detection in yolo_results:
-            # Get bounding box
-            bbox = detection['bbox']
-            x1, y1, x2, y2 = bbox
-            
-            # Perform NIR scan on detected region
-            try:
-                nir_result = self.nir_scanner.scan(region=(int(x1), int(y1), int(x2), int(y2)))
-                nir_analysis = nir_result.get('analysis', {})
-            except Exception as e:
-                print(f"Warning: NIR scan failed for region {bbox}: {e}")
-                # Use default NIR analysis if scan fails
-                nir_analysis = {
-                    'ripeness_score': 0.5,
-                    'ripeness_category': 'Unknown',
-                    'quality_score': 0.5,
-                    'confidence': 0.5
+        if not yolo_results:
+            return []
+        
+        # With NIR turned off, pass YOLO's assessment through unchanged
+        if not self._nir_enabled:
+            return [
+                {
+                    **detection,
+                    'yolo_confidence': detection.get('confidence', 0.5),
+                    'nir_confidence': 0.0,
+                    'fusion_method': 'yolo_only'
                 }
-            
-            # Fuse YOLO and NIR results
-            fused_detection = self._fuse_single_detection(detection, nir_analysis)
-            fused_results.append(fused_detection)
+                for detection in yolo_results
+            ]
+        
+        # Scan every detected region in one batched NIR call
+        regions = [tuple(int(v) for v in detection['bbox']) for detection in yolo_results]
+        try:
+            nir_analyses = [nir_result.get('analysis', {}) for nir_result in self.nir_scanner.scan_batch(regions)]
+        except Exception as e:
+            logger.warning("Batched NIR scan failed, scanning regions individually: %s", e)
+            # Regions are independent of each other, so under gevent they are acquired concurrently
+            if gevent and len(yolo_results) > 1:
+                jobs = [gevent.spawn(self._scan_region, detection['bbox']) for detection in yolo_results]
+                gevent.joinall(jobs)
+                nir_analyses = [job.value for job in jobs]
+            else:
+                nir_analyses = [self._scan_region(detection['bbox']) for detection in yolo_results]
+        
+        # Large batches run the numeric fusion for every detection at once
+        if len(yolo_results) >= self.BATCH_FUSION_MIN_DETECTIONS:
+            batch_scores = self._batch_fuse_scores(yolo_results, nir_analyses)
+        else:
+            batch_scores = [None] * len(yolo_results)
         
-        return fused_results
+        # Fuse YOLO and NIR results
+        return [
+            self._fuse_single_detection(detection, nir_analysis, fused_scores)
+            for detection, nir_analysis, fused_scores in zip(yolo_results, nir_analyses, batch_scores)
+        ]
     
-    def _fuse_single_detection(self, yolo_detection: Dict, nir_analysis: Dict) -> Dict:
+    def _batch_fuse_scores(self, yolo_results: List[Dict],
+                           nir_analyses: List[Dict]) -> List[Tuple[bool, float, float, str]]:
+        """
+        Compute the numeric part of _fuse_single_detection for a batch of detections
+        
+        Args:
+            yolo_results: List of YOLO detection results
+            nir_analyses: NIR analysis result per detection
+        
+        Returns:
+            List of (ripeness agreement, ripeness confidence, overall confidence, quality status) tuples
+        """
+        yolo_quality = [detection.get('quality_status', 'unknown') for detection in yolo_results]
+        
+        agreements = self._batch_ripeness_agreement(
+            [detection.get('ripeness', 'Unknown') for detection in yolo_results],
+            [nir_analysis.get('ripeness_category', 'Unknown') for nir_analysis in nir_analyses]
+        )
+        overall_conf, ripeness_conf, quality_idx = _fuse_scores(
+            np.array([detection.get('confidence', 0.5) for detection in yolo_results], dtype=np.float64),
+            np.array([nir_analysis.get('confidence', 0.5) for nir_analysis in nir_analyses], dtype=np.float64),
+            agreements,
+            np.array([_QUALITY_INDEX.get(q, -1) for q in yolo_quality], dtype=np.int64),
+            np.array([_YOLO_QUALITY_SCORES.get(q, 0.4) for q in yolo_quality], dtype=np.float64),
+            np.array([nir_analysis.get('quality_score', 0.5) for nir_analysis in nir_analyses], dtype=np.float64),
+            float(self.yolo_weight),
+            float(self.nir_weight)
+        )
+        
+        return list(zip(
+            agreements.tolist(),
+            ripeness_conf.tolist(),
+            overall_conf.tolist(),
+            [_QUALITY_STATUSES[i] for i in quality_idx.tolist()]
+        ))
+    
+    def _scan_region(self, bbox: List[float]) -> Dict:
+        """
+        Perform NIR scan on a detected region
+        
+        Args:
+            bbox: Bounding box (x1, y1, x2, y2) of the detection
+        
+        Returns:
+            NIR analysis dictionary (defaults if the scan fails)
+        """
+        x1, y1, x2, y2 = bbox
+        try:
+            nir_result = self.nir_scanner.scan(region=(int(x1), int(y1), int(x2), int(y2)))
+            return nir_result.get('analysis', {})
+        except Exception as e:
+            logger.warning("NIR scan failed for region %s: %s", bbox, e)
+            # Use default NIR analysis if scan fails
+            return {
+                'ripeness_score': 0.5,
+                'ripeness_category': 'Unknown',
+                'quality_score': 0.5,
+                'confidence': 0.5
+            }
+    
+    def _fuse_single_detection(self, yolo_detection: Dict, nir_analysis: Dict,
+                               fused_scores: Optional[Tuple[bool, float, float, str]] = None) -> Dict:
         """
         Fuse a single YOLO detection with NIR analysis
         
         Args:
             yolo_detection: Single YOLO detection result
             nir_analysis: NIR analysis result
+            fused_scores: Scores precomputed by _batch_fuse_scores (computed here if None)
         
         Returns:
             Fused detection result
@@ -93,25 +267,32 @@ class FusionEngine:
         yolo_ripeness_lower = yolo_ripeness.lower()
         nir_ripeness_lower = nir_ripeness.lower()
         
-        # Check if ripeness assessments are similar
-        ripeness_agreement = self._check_ripeness_agreement(yolo_ripeness_lower, nir_ripeness_lower)
+        if fused_scores is None:
+            # Check if ripeness assessments are similar
+            ripeness_agreement = self._check_ripeness_agreement(yolo_ripeness_lower, nir_ripeness_lower)
+            
+            if ripeness_agreement:
+                # High agreement - boost confidence
+                ripeness_confidence = min(1.0, (yolo_confidence + nir_confidence) / 2 + 0.1)
+            else:
+                ripeness_confidence = (yolo_confidence + nir_confidence) / 2
+            
+            # Fuse quality status
+            final_quality = self._fuse_quality_status(yolo_quality, nir_quality_score, yolo_confidence, nir_confidence)
+            
+            # Calculate overall confidence (weighted average)
+            overall_confidence = (yolo_confidence * self.yolo_weight + nir_confidence * self.nir_weight)
+        else:
+            ripeness_agreement, ripeness_confidence, overall_confidence, final_quality = fused_scores
         
         # Determine final ripeness
         if ripeness_agreement:
-            # High agreement - use YOLO result with boosted confidence
+            # High agreement - use YOLO result
             final_ripeness = yolo_ripeness
-            ripeness_confidence = min(1.0, (yolo_confidence + nir_confidence) / 2 + 0.1)
         else:
             # Disagreement - use weighted combination
             # Prefer YOLO for type, NIR for ripeness assessment
             final_ripeness = self._combine_ripeness(yolo_ripeness, nir_ripeness, yolo_confidence, nir_confidence)
-            ripeness_confidence = (yolo_confidence + nir_confidence) / 2
-        
-        # Fuse quality status
-        final_quality = self._fuse_quality_status(yolo_quality, nir_quality_score, yolo_confidence, nir_confidence)
-        
-        # Calculate overall confidence (weighted average)
-        overall_confidence = (yolo_confidence * self.yolo_weight + nir_confidence * self.nir_weight)
         
         # Build fused result
         fused_result = {
@@ -144,49 +325,38 @@ class FusionEngine:
         Returns:
             True if assessments agree, False otherwise
         """
-        # Define ripeness categories
-        unripe_keywords = ['unripe', 'underripe']
-        half_ripe_keywords = ['half-ripe', 'half ripe']
-        ripe_keywords = ['ripe']
-        overripe_keywords = ['overripe', 'over-ripe']
-        
-        # Categorize YOLO ripeness
-        yolo_category = None
-        if any(kw in yolo_ripeness for kw in unripe_keywords):
-            yolo_category = 'unripe'
-        elif any(kw in yolo_ripeness for kw in half_ripe_keywords):
-            yolo_category = 'half-ripe'
-        elif any(kw in yolo_ripeness for kw in ripe_keywords) and not any(kw in yolo_ripeness for kw in overripe_keywords):
-            yolo_category = 'ripe'
-        elif any(kw in yolo_ripeness for kw in overripe_keywords):
-            yolo_category = 'overripe'
-        
-        # Categorize NIR ripeness
-        nir_category = None
-        if any(kw in nir_ripeness for kw in unripe_keywords):
-            nir_category = 'unripe'
-        elif any(kw in nir_ripeness for kw in half_ripe_keywords):
-            nir_category = 'half-ripe'
-        elif any(kw in nir_ripeness for kw in ripe_keywords) and not any(kw in nir_ripeness for kw in overripe_keywords):
-            nir_category = 'ripe'
-        elif any(kw in nir_ripeness for kw in overripe_keywords):
-            nir_category = 'overripe'
+        # Categorize both assessments
+        yolo_category = _ripeness_category(yolo_ripeness)
+        nir_category = _ripeness_category(nir_ripeness)
         
         # Check agreement (allow adjacent categories as agreement)
         if yolo_category == nir_category:
             return True
         elif yolo_category and nir_category:
             # Check if categories are adjacent (e.g., unripe and half-ripe)
-            category_order = ['unripe', 'half-ripe', 'ripe', 'overripe']
-            try:
-                yolo_idx = category_order.index(yolo_category)
-                nir_idx = category_order.index(nir_category)
-                return abs(yolo_idx - nir_idx) <= 1
-            except ValueError:
-                return False
+            return abs(_RIPENESS_ORDER[yolo_category] - _RIPENESS_ORDER[nir_category]) <= 1
         
         return False
     
+    @staticmethod
+    def _batch_ripeness_agreement(yolo_ripeness: List[str], nir_ripeness: List[str]) -> np.ndarray:
+        """
+        Vectorized _check_ripeness_agreement over many detections
+        
+        Args:
+            yolo_ripeness: YOLO ripeness assessment per detection
+            nir_ripeness: NIR ripeness assessment per detection
+        
+        Returns:
+            Boolean array, True where the assessments agree
+        """
+        yolo_idx = _ripeness_category_indices(yolo_ripeness)
+        nir_idx = _ripeness_category_indices(nir_ripeness)
+        
+        # Same category (including both unrecognized), or adjacent recognized categories
+        known = (yolo_idx >= 0) & (nir_idx >= 0)
+        return (yolo_idx == nir_idx) | (known & (np.abs(yolo_idx - nir_idx) <= 1))
+    
     def _combine_ripeness(self, yolo_ripeness: str, nir_ripeness: str, 
                          yolo_conf: float, nir_conf: float) -> str:
         """
@@ -225,14 +395,7 @@ class FusionEngine:
             Fused quality status
         """
         # Map NIR quality score to status
-        if nir_quality_score >= 0.8:
-            nir_quality = 'fresh'
-        elif nir_quality_score >= 0.6:
-            nir_quality = 'ripe'
-        elif nir_quality_score >= 0.4:
-            nir_quality = 'unripe'
-        else:
-            nir_quality = 'overripe'
+        nir_quality = _QUALITY_STATUSES[bisect_right(_NIR_QUALITY_THRESHOLDS, nir_quality_score)]
         
         # Combine with YOLO quality
         # If both agree, use that
@@ -240,17 +403,10 @@ class FusionEngine:
             return yolo_quality
         
         # If disagree, use weighted decision
-        combined_score = (nir_quality_score * self.nir_weight + 
-                         (0.8 if yolo_quality == 'fresh' else 0.6 if yolo_quality == 'ripe' else 0.4) * self.yolo_weight)
-        
-        if combined_score >= 0.75:
-            return 'fresh'
-        elif combined_score >= 0.55:
-            return 'ripe'
-        elif combined_score >= 0.35:
-            return 'unripe'
-        else:
-            return 'overripe'
+        combined_score = (nir_quality_score * self.nir_weight +
+                          _YOLO_QUALITY_SCORES.get(yolo_quality, 0.4) * self.yolo_weight)
+        
+        return _QUALITY_STATUSES[bisect_right(_COMBINED_QUALITY_THRESHOLDS, combined_score)]
     
     def set_fusion_weights(self, yolo_weight: float, nir_weight: float):
         """
@@ -265,5 +421,5 @@ class FusionEngine:
         
         self.yolo_weight = yolo_weight
         self.nir_weight = nir_weight
-        print(f"Fusion weights updated: YOLO={yolo_weight}, NIR={nir_weight}")
+        logger.info("Fusion weights updated: YOLO=%s, NIR=%s", yolo_weight, nir_weight)
 
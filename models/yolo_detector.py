@@ -1,18 +1,88 @@
 """
 YOLO Detector module for fruit detection
 """
+import logging
 import cv2
 import numpy as np
 from pathlib import Path
+from types import MappingProxyType
 from ultralytics import YOLO
 import yaml
-from typing import List, Dict, Tuple, Optional
+from typing import Iterator, List, Dict, Mapping, Tuple, Optional
+
+# libyaml's C loader when available, same safe semantics as yaml.safe_load
+try:
+    from yaml import CSafeLoader as _YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlSafeLoader
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+# Ripeness keywords stripped from class names (order matters - longer/compound words first)
+_RIPENESS_KEYWORDS = ('overripe', 'over-ripe', 'half-ripe', 'half ripe', 'underripe', 'unripe', 'ripe', 'rotten', 'fresh')
+# The same keywords as word lists, for matching against a class name's words
+_RIPENESS_KEYWORD_WORDS = tuple((keyword, keyword.split()) for keyword in _RIPENESS_KEYWORDS)
+
+# (keyword, quality_status, ripeness) for _parse_quality_status, highest priority first
+_QUALITY_KEYWORDS = (
+    ('unripe', 'unripe', 'Unripe'),
+    ('overripe', 'overripe', 'Overripe'),
+    ('over-ripe', 'overripe', 'Overripe'),
+    ('half-ripe', 'ripe', 'Half-Ripe'),
+    ('half ripe', 'ripe', 'Half-Ripe'),
+    ('ripe', 'ripe', 'Ripe'),
+    ('rotten', 'rotten', 'Overripe'),  # Treat rotten as overripe
+    ('fresh', 'fresh', 'Ripe'),        # Treat fresh as ripe
+)
+
+
+def _build_quality_automaton():
+    """Build an Aho-Corasick automaton over _QUALITY_KEYWORDS (None if pyahocorasick is missing)"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for rank, (keyword, quality_status, ripeness) in enumerate(_QUALITY_KEYWORDS):
+        automaton.add_word(keyword, (rank, quality_status, ripeness))
+    automaton.make_automaton()
+    return automaton
+
+
+# Matches every quality keyword in one pass over a class name
+_QUALITY_AUTOMATON = _build_quality_automaton()
+
+# Annotation box color (BGR) per quality status
+_QUALITY_COLORS = {
+    'fresh': (0, 255, 0),      # Green
+    'ripe': (255, 255, 0),      # Yellow
+    'unripe': (0, 255, 255),    # Cyan
+    'overripe': (0, 165, 255),  # Orange
+    'rotten': (0, 0, 255),      # Red
+    'unknown': (128, 128, 128)  # Gray
+}
+# JPEG quality for annotated images
+_ANNOTATED_JPEG_QUALITY = 90
+# Label font for annotated images
+_LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_LABEL_FONT_SCALE = 0.6
+_LABEL_THICKNESS = 2
 
 
 class YOLODetector:
     """YOLO-based fruit detector"""
     
-    def __init__(self, model_path: str, data_yaml_path: str, confidence_threshold: float = 0.25, iou_threshold: float = 0.45):
+    # Export settings for accelerated backends. Exports use dynamic input shapes, so one engine
+    # serves single-image detect() and detect_batch() calls up to ENGINE_BATCH images
+    ENGINE_IMGSZ = 640
+    ENGINE_BATCH = 16
+    ENGINE_WORKSPACE_GB = 4
+    
+    def __init__(self, model_path: str, data_yaml_path: str, confidence_threshold: float = 0.25, iou_threshold: float = 0.45,
+                 precision: str = 'fp32'):
         """
         Initialize YOLO detector
         
@@ -21,6 +91,9 @@ class YOLODetector:
             data_yaml_path: Path to data.yaml file with class names
             confidence_threshold: Confidence threshold for detections
             iou_threshold: IoU threshold for NMS
+            precision: 'fp32' runs the PyTorch weights; 'fp16' or 'int8' run a TensorRT engine (CUDA GPU)
+                or an OpenVINO model (CPU) exported next to the weights (falls back to the weights
+                if export is not possible, in FP16 on CUDA GPUs for 'fp16')
         """
         self.model_path = Path(model_path)
         self.data_yaml_path = Path(data_yaml_path)
@@ -32,9 +105,14 @@ class YOLODetector:
             raise FileNotFoundError(f"Model file not found: {model_path}")
         
         self.model = YOLO(str(self.model_path))
+        self._half = False  # True when the PyTorch model itself runs in FP16 on the GPU
+        if precision in ('fp16', 'int8'):
+            self.model = self._prepare_backend(precision)
         
         # Load class names from data.yaml (override model's class names)
         self.class_names = self._load_class_names()
+        # Read-only view handed out by get_class_names (no copy per call)
+        self._class_names_view = MappingProxyType(self.class_names)
         
         # Override model's class names with our custom names
         if self.class_names:
@@ -48,26 +126,157 @@ class YOLODetector:
                         if class_id < len(self.model.names):
                             self.model.names[class_id] = class_name
         
-        print(f"YOLO detector loaded with {len(self.class_names)} classes")
+        # Resolve the name of every class the model can emit once: data.yaml names first,
+        # then the model's own names
+        model_names = getattr(self.model, 'names', None) or {}
+        if isinstance(model_names, list):
+            model_names = dict(enumerate(model_names))
+        resolved_names = {**model_names, **self.class_names}
+        
+        model_only_ids = sorted(set(resolved_names) - set(self.class_names))
+        if model_only_ids:
+            logger.warning("Class IDs %s not found in class_names, using the model's names", model_only_ids)
+        
+        # Class ID -> (class name, fruit type, quality status, ripeness), parsed once per class
+        self._class_meta = {
+            class_id: (class_name, self._extract_fruit_type(class_name), *self._parse_quality_status(class_name))
+            for class_id, class_name in resolved_names.items()
+        }
+        
+        logger.info("YOLO detector loaded with %d classes", len(self.class_names))
         if len(self.class_names) > 0:
-            print(f"Class names: {list(self.class_names.values())[:5]}..." if len(self.class_names) > 5 else f"Class names: {list(self.class_names.values())}")
+            logger.debug("Class names: %s", list(self.class_names.values()))
+        
+        self.warmup()
+    
+    def warmup(self) -> None:
+        """Run one inference on a blank frame so the first real detection skips model/kernel setup"""
+        try:
+            self.model.predict(
+                source=np.zeros((self.ENGINE_IMGSZ, self.ENGINE_IMGSZ, 3), dtype=np.uint8),
+                half=self._half,
+                verbose=False
+            )
+        except Exception as e:
+            logger.warning("YOLO warmup failed: %s", e)
+    
+    def _prepare_backend(self, precision: str):
+        """
+        Load the accelerated backend for a reduced precision: TensorRT on CUDA GPUs, OpenVINO on CPU
+        
+        Args:
+            precision: 'fp16' or 'int8'
+        
+        Returns:
+            YOLO model backed by the exported model, or the PyTorch model if export is not possible
+        """
+        try:
+            import torch
+            has_cuda = torch.cuda.is_available()
+        except ImportError:
+            has_cuda = False
+        
+        if has_cuda:
+            engine = self._load_tensorrt_engine(precision)
+            if engine is self.model and precision == 'fp16':
+                # No TensorRT: run the PyTorch weights in FP16 on the GPU (tensor cores, half the bandwidth)
+                self.model.to('cuda')
+                self.model.model.half()
+                self._half = True
+                logger.info("Using PyTorch FP16 weights on CUDA")
+            return engine
+        return self._load_openvino_model(precision)
+    
+    def _load_tensorrt_engine(self, precision: str):
+        """
+        Load (exporting on first use) a TensorRT engine for the model weights
+        
+        Args:
+            precision: 'fp16' or 'int8' (int8 calibrates on the dataset in data.yaml)
+        
+        Returns:
+            YOLO model backed by the engine, or the PyTorch model if TensorRT is unavailable
+        """
+        engine_path = self.model_path.with_name(f"{self.model_path.stem}_{precision}.engine")
+        
+        try:
+            if not engine_path.exists():
+                logger.info("Exporting TensorRT %s engine to %s (one-time, may take several minutes)", precision, engine_path)
+                exported_path = self.model.export(
+                    format='engine',
+                    half=precision == 'fp16',
+                    int8=precision == 'int8',
+                    data=str(self.data_yaml_path) if precision == 'int8' else None,
+                    imgsz=self.ENGINE_IMGSZ,
+                    dynamic=True,
+                    batch=self.ENGINE_BATCH,
+                    workspace=self.ENGINE_WORKSPACE_GB
+                )
+                # Cache under a per-precision name so fp16 and int8 engines can coexist
+                Path(exported_path).replace(engine_path)
+            
+            logger.info("Using TensorRT %s engine: %s", precision, engine_path)
+            return YOLO(str(engine_path), task='detect')
+        
+        except Exception as e:
+            logger.warning("Could not load TensorRT %s engine, using PyTorch weights: %s", precision, e)
+            return self.model
+    
+    def _load_openvino_model(self, precision: str):
+        """
+        Load (exporting on first use) an OpenVINO model for CPU inference
+        
+        Args:
+            precision: 'fp16' or 'int8' (int8 calibrates on the dataset in data.yaml and
+                falls back to an FP32 export if calibration fails)
+        
+        Returns:
+            YOLO model backed by OpenVINO, or the PyTorch model if OpenVINO is unavailable
+        """
+        model_dir = self.model_path.with_name(f"{self.model_path.stem}_{precision}_openvino_model")
+        
+        try:
+            if not model_dir.exists():
+                logger.info("Exporting OpenVINO %s model to %s (one-time, may take several minutes)", precision, model_dir)
+                try:
+                    exported_dir = self.model.export(
+                        format='openvino',
+                        half=precision == 'fp16',
+                        int8=precision == 'int8',
+                        data=str(self.data_yaml_path) if precision == 'int8' else None,
+                        imgsz=self.ENGINE_IMGSZ,
+                        dynamic=True
+                    )
+                except Exception as e:
+                    if precision != 'int8':
+                        raise
+                    logger.warning("OpenVINO INT8 calibration failed, exporting FP32 instead: %s", e)
+                    exported_dir = self.model.export(format='openvino', imgsz=self.ENGINE_IMGSZ, dynamic=True)
+                Path(exported_dir).replace(model_dir)
+            
+            logger.info("Using OpenVINO %s model: %s", precision, model_dir)
+            return YOLO(str(model_dir), task='detect')
+        
+        except Exception as e:
+            logger.warning("Could not load OpenVINO %s model, using PyTorch weights: %s", precision, e)
+            return self.model
     
     def _load_class_names(self) -> Dict[int, str]:
         """Load class names from data.yaml"""
         try:
             if not self.data_yaml_path.exists():
-                print(f"Warning: data.yaml not found at {self.data_yaml_path}, using default class names")
+                logger.warning("data.yaml not found at %s, using default class names", self.data_yaml_path)
                 return self._get_default_class_names()
             
             with open(self.data_yaml_path, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
+                data = yaml.load(f, Loader=_YamlSafeLoader)
                 if not data:
-                    print(f"Warning: data.yaml is empty, using default class names")
+                    logger.warning("data.yaml is empty, using default class names")
                     return self._get_default_class_names()
                 
                 names = data.get('names', {})
                 if not names:
-                    print(f"Warning: No 'names' key found in data.yaml, using default class names")
+                    logger.warning("No 'names' key found in data.yaml, using default class names")
                     return self._get_default_class_names()
                 
                 # Convert to integer keys if they're strings
@@ -77,20 +286,18 @@ class YOLODetector:
                         class_id = int(key)
                         class_names[class_id] = str(value).strip()
                     except (ValueError, TypeError) as e:
-                        print(f"Warning: Invalid class entry '{key}: {value}', skipping: {e}")
+                        logger.warning("Invalid class entry '%s: %s', skipping: %s", key, value, e)
                         continue
                 
                 if not class_names:
-                    print(f"Warning: No valid class names loaded, using default class names")
+                    logger.warning("No valid class names loaded, using default class names")
                     return self._get_default_class_names()
                 
-                print(f"Successfully loaded {len(class_names)} class names from {self.data_yaml_path}")
+                logger.info("Successfully loaded %d class names from %s", len(class_names), self.data_yaml_path)
                 return class_names
                 
         except Exception as e:
-            print(f"Warning: Could not load class names from {self.data_yaml_path}: {e}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
+            logger.warning("Could not load class names from %s: %s", self.data_yaml_path, e, exc_info=True)
             return self._get_default_class_names()
     
     def _get_default_class_names(self) -> Dict[int, str]:
@@ -126,67 +333,144 @@ class YOLODetector:
         if not Path(image_path).exists():
             raise FileNotFoundError(f"Image file not found: {image_path}")
         
+        # Decode with OpenCV (BGR, as ultralytics expects for arrays); formats OpenCV cannot
+        # read are left to ultralytics' own loader
+        image = cv2.imread(image_path)
+        return self._predict(image if image is not None else image_path)
+    
+    def detect_batch(self, image_paths: List[str], batch_size: int = 16) -> List[List[Dict]]:
+        """
+        Detect fruits in several images, running up to batch_size images per forward pass
+        
+        Args:
+            image_paths: Paths to input images
+            batch_size: Maximum number of images per forward pass
+            
+        Returns:
+            List of detection lists, one per input image, in input order
+        """
+        for image_path in image_paths:
+            if not Path(image_path).exists():
+                raise FileNotFoundError(f"Image file not found: {image_path}")
+        
+        detections = []
+        for start in range(0, len(image_paths), batch_size):
+            # A list source is inferred as one batch
+            results = self.model.predict(
+                source=list(image_paths[start:start + batch_size]),
+                conf=self.confidence_threshold,
+                iou=self.iou_threshold,
+                half=self._half,
+                verbose=False
+            )
+            detections.extend(self._parse_result(result) for result in results)
+        
+        return detections
+    
+    def detect_stream(self, source, batch: int = 1) -> Iterator[List[Dict]]:
+        """
+        Detect fruits frame by frame in a folder, video, glob or stream source
+        
+        Results are produced lazily, so memory use does not grow with the length of the source.
+        
+        Args:
+            source: Any source ultralytics accepts (directory, video file, glob, stream URL, ...)
+            batch: Number of frames per forward pass
+            
+        Yields:
+            Detection list for each frame, in source order
+        """
+        results = self.model.predict(
+            source=source,
+            conf=self.confidence_threshold,
+            iou=self.iou_threshold,
+            batch=batch,
+            stream=True,
+            half=self._half,
+            verbose=False
+        )
+        for result in results:
+            yield self._parse_result(result)
+    
+    def detect_array(self, image: np.ndarray) -> List[Dict]:
+        """
+        Detect fruits in an already decoded image
+        
+        Args:
+            image: BGR image array (as returned by cv2.imread / cv2.imdecode)
+            
+        Returns:
+            List of detection results with bounding boxes, classes, and confidence scores
+        """
+        return self._predict(image)
+    
+    @staticmethod
+    def decode_image(data: bytes) -> Optional[np.ndarray]:
+        """
+        Decode encoded image bytes (JPEG, PNG, ...) into a BGR array
+        
+        Args:
+            data: Encoded image bytes
+            
+        Returns:
+            BGR image array, or None if the bytes could not be decoded
+        """
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    
+    def _predict(self, source) -> List[Dict]:
+        """Run inference on an image path or array and parse the detections"""
         # Run inference
         results = self.model.predict(
-            source=image_path,
+            source=source,
             conf=self.confidence_threshold,
             iou=self.iou_threshold,
+            half=self._half,
             verbose=False
         )
         
         # Parse results
-        detections = []
         if len(results) > 0:
-            result = results[0]
+            return self._parse_result(results[0])
+        return []
+    
+    def _parse_result(self, result) -> List[Dict]:
+        """Convert one ultralytics result into detection dictionaries"""
+        detections = []
+        
+        # Get boxes, classes, and confidences
+        boxes = result.boxes
+        if boxes is not None and len(boxes) > 0:
+            # Copy every box to host memory at once (one device sync per tensor, not per box)
+            xyxy = boxes.xyxy.cpu().numpy().tolist()
+            class_ids = boxes.cls.cpu().numpy().astype(np.int32).tolist()
+            confidences = boxes.conf.cpu().numpy().tolist()
             
-            # Get boxes, classes, and confidences
-            boxes = result.boxes
-            if boxes is not None and len(boxes) > 0:
-                for i in range(len(boxes)):
-                    box = boxes[i]
-                    
-                    # Get bounding box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    
-                    # Get class ID and confidence
-                    class_id = int(box.cls[0].cpu().numpy())
-                    confidence = float(box.conf[0].cpu().numpy())
-                    
-                    # Get class name - ensure we always get a proper name
-                    class_name = self.class_names.get(class_id)
-                    if class_name is None:
-                        # Try to get from model's names if available
-                        if hasattr(self.model, 'names') and self.model.names:
-                            if isinstance(self.model.names, dict):
-                                class_name = self.model.names.get(class_id, f"Class_{class_id}")
-                            elif isinstance(self.model.names, list) and class_id < len(self.model.names):
-                                class_name = self.model.names[class_id]
-                            else:
-                                class_name = f"Class_{class_id}"
-                        else:
-                            class_name = f"Class_{class_id}"
-                        print(f"Warning: Class ID {class_id} not found in class_names, using: {class_name}")
-                    
-                    # Determine quality status and ripeness from class name
-                    quality_status, ripeness = self._parse_quality_status(class_name)
-                    
-                    # Extract fruit type (remove ripeness from class name)
-                    fruit_type = self._extract_fruit_type(class_name)
-                    
-                    detection = {
-                        'bbox': [float(x1), float(y1), float(x2), float(y2)],
-                        'class_id': class_id,
-                        'class_name': class_name,
-                        'fruit_type': fruit_type,  # Just the fruit name (e.g., "Pineapple", "Banana")
-                        'confidence': confidence,
-                        'quality_status': quality_status,  # unripe, ripe, overripe
-                        'ripeness': ripeness  # Unripe, Ripe, Overripe
-                    }
-                    
-                    detections.append(detection)
+            for (x1, y1, x2, y2), class_id, confidence in zip(xyxy, class_ids, confidences):
+                # Class name, fruit type, quality status and ripeness were parsed at init
+                class_meta = self._class_meta.get(class_id) or self._unknown_class_meta(class_id)
+                class_name, fruit_type, quality_status, ripeness = class_meta
+                
+                detection = {
+                    'bbox': [x1, y1, x2, y2],
+                    'class_id': class_id,
+                    'class_name': class_name,
+                    'fruit_type': fruit_type,  # Just the fruit name (e.g., "Pineapple", "Banana")
+                    'confidence': confidence,
+                    'quality_status': quality_status,  # unripe, ripe, overripe
+                    'ripeness': ripeness  # Unripe, Ripe, Overripe
+                }
+                
+                detections.append(detection)
         
         return detections
     
+    def _unknown_class_meta(self, class_id: int) -> Tuple[str, str, str, str]:
+        """Name and parse a class ID unknown to both data.yaml and the model (same tuple layout as _class_meta)"""
+        class_name = f"Class_{class_id}"
+        logger.warning("Class ID %d not found in class_names, using: %s", class_id, class_name)
+        
+        return (class_name, self._extract_fruit_type(class_name), *self._parse_quality_status(class_name))
+    
     def _parse_quality_status(self, class_name: str) -> Tuple[str, str]:
         """
         Parse quality status and ripeness from class name
@@ -200,36 +484,21 @@ class YOLODetector:
         """
         class_lower = class_name.lower()
         
-        # Extract fruit type and ripeness level
-        # Format is: "{Fruit} {Ripeness}" or old format variations
-        parts = class_name.split()
+        # Single pass over the name, keeping the highest-priority keyword found
+        if _QUALITY_AUTOMATON is not None:
+            matches = [match for _, match in _QUALITY_AUTOMATON.iter(class_lower)]
+            if not matches:
+                return 'unknown', 'Unknown'
+            _, quality_status, ripeness = min(matches)
+            return quality_status, ripeness
         
-        # Determine ripeness from class name
-        if 'unripe' in class_lower:
-            ripeness = 'Unripe'
-            quality_status = 'unripe'
-        elif 'overripe' in class_lower or 'over-ripe' in class_lower:
-            ripeness = 'Overripe'
-            quality_status = 'overripe'
-        elif 'ripe' in class_lower:
-            # Check if it's "half-ripe" or just "ripe"
-            if 'half-ripe' in class_lower or 'half ripe' in class_lower:
-                ripeness = 'Half-Ripe'
-                quality_status = 'ripe'
-            else:
-                ripeness = 'Ripe'
-                quality_status = 'ripe'
-        elif 'rotten' in class_lower:
-            ripeness = 'Overripe'  # Treat rotten as overripe
-            quality_status = 'rotten'
-        elif 'fresh' in class_lower:
-            ripeness = 'Ripe'  # Treat fresh as ripe
-            quality_status = 'fresh'
-        else:
-            ripeness = 'Unknown'
-            quality_status = 'unknown'
-        
-        return quality_status, ripeness
+        # Without the automaton, check keywords in priority order; compound keywords come
+        # before 'ripe' so "Overripe" and "Half-Ripe" never fall through to plain Ripe
+        for keyword, quality_status, ripeness in _QUALITY_KEYWORDS:
+            if keyword in class_lower:
+                return quality_status, ripeness
+        
+        return 'unknown', 'Unknown'
     
     def _extract_fruit_type(self, class_name: str) -> str:
         """
@@ -242,11 +511,6 @@ class YOLODetector:
         Returns:
             Fruit type only (e.g., "Pineapple", "Banana", "Mango")
         """
-        import re
-        
-        # List of ripeness keywords (order matters - check longer/compound words first)
-        ripeness_keywords = ['overripe', 'over-ripe', 'half-ripe', 'half ripe', 'underripe', 'unripe', 'ripe', 'rotten', 'fresh']
-        
         # Split the class name into parts
         parts = class_name.split()
         
@@ -259,7 +523,7 @@ class YOLODetector:
         
         # Check for exact match or if last part contains a ripeness keyword
         matched_keyword = None
-        for keyword in ripeness_keywords:
+        for keyword in _RIPENESS_KEYWORDS:
             if last_part_lower == keyword or keyword in last_part_lower:
                 matched_keyword = keyword
                 break
@@ -269,25 +533,16 @@ class YOLODetector:
             fruit_type = ' '.join(parts[:-1]).strip()
             return fruit_type
         
-        # If last part doesn't match, try to find and remove ripeness keyword from anywhere
+        # If last part doesn't match, try to find and remove a ripeness keyword standing as
+        # its own word(s) at the start or in the middle
         class_lower = class_name.lower()
-        for keyword in ripeness_keywords:
+        parts_lower = class_lower.split()
+        for keyword, keyword_words in _RIPENESS_KEYWORD_WORDS:
             if keyword in class_lower:
-                # Remove the keyword and any surrounding spaces
-                pattern = r'\s+' + re.escape(keyword) + r'\s*$'  # At end with space before
-                fruit_type = re.sub(pattern, '', class_name, flags=re.IGNORECASE)
-                if fruit_type != class_name:
-                    return fruit_type.strip()
-                
-                pattern = r'^\s*' + re.escape(keyword) + r'\s+'  # At start with space after
-                fruit_type = re.sub(pattern, '', class_name, flags=re.IGNORECASE)
-                if fruit_type != class_name:
-                    return fruit_type.strip()
-                
-                pattern = r'\s+' + re.escape(keyword) + r'\s+'  # In middle with spaces
-                fruit_type = re.sub(pattern, ' ', class_name, flags=re.IGNORECASE)
-                if fruit_type != class_name:
-                    return fruit_type.strip()
+                n = len(keyword_words)
+                for i in range(len(parts) - n):
+                    if parts_lower[i:i + n] == keyword_words:
+                        return ' '.join(parts[:i] + parts[i + n:])
         
         # Fallback: if no keyword found, assume last part is ripeness and remove it
         return ' '.join(parts[:-1]).strip() if len(parts) > 1 else class_name
@@ -306,26 +561,31 @@ class YOLODetector:
         if image is None:
             raise ValueError(f"Could not read image: {input_path}")
         
+        self.save_annotated_array(image, output_path, detections)
+    
+    def save_annotated_array(self, image: np.ndarray, output_path: str, detections: List[Dict]) -> None:
+        """
+        Draw bounding box annotations on a decoded image and save it
+        
+        Args:
+            image: BGR image array (annotations are drawn in place)
+            output_path: Path to save annotated image
+            detections: List of detection results
+        """
+        # Convert every box to integer pixel coordinates at once
+        boxes = np.asarray([detection['bbox'] for detection in detections], dtype=np.float64).reshape(-1, 4)
+        boxes = boxes.astype(np.int32).tolist()
+        
+        # Label -> text size; crates of same-class fruit repeat the same labels
+        text_sizes: Dict[str, Tuple[Tuple[int, int], int]] = {}
+        
         # Draw bounding boxes
-        for detection in detections:
-            x1, y1, x2, y2 = detection['bbox']
+        for detection, (x1, y1, x2, y2) in zip(detections, boxes):
             class_name = detection['class_name']
             confidence = detection['confidence']
-            quality_status = detection['quality_status']
-            
-            # Convert to integers
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
             
             # Choose color based on quality status
-            color_map = {
-                'fresh': (0, 255, 0),      # Green
-                'ripe': (255, 255, 0),      # Yellow
-                'unripe': (0, 255, 255),    # Cyan
-                'overripe': (0, 165, 255),  # Orange
-                'rotten': (0, 0, 255),      # Red
-                'unknown': (128, 128, 128)  # Gray
-            }
-            color = color_map.get(quality_status, (128, 128, 128))
+            color = _QUALITY_COLORS.get(detection['quality_status'], (128, 128, 128))
             
             # Draw bounding box
             cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
@@ -334,9 +594,12 @@ class YOLODetector:
             label = f"{class_name} {confidence:.2f}"
             
             # Calculate text size
-            (text_width, text_height), baseline = cv2.getTextSize(
-                label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2
-            )
+            text_size = text_sizes.get(label)
+            if text_size is None:
+                text_size = text_sizes[label] = cv2.getTextSize(
+                    label, _LABEL_FONT, _LABEL_FONT_SCALE, _LABEL_THICKNESS
+                )
+            (text_width, text_height), baseline = text_size
             
             # Draw label background
             cv2.rectangle(
@@ -352,18 +615,18 @@ class YOLODetector:
                 image,
                 label,
                 (x1, y1 - baseline - 5),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
+                _LABEL_FONT,
+                _LABEL_FONT_SCALE,
                 (255, 255, 255),
-                2
+                _LABEL_THICKNESS
             )
         
         # Save annotated image
         output_path_obj = Path(output_path)
         output_path_obj.parent.mkdir(parents=True, exist_ok=True)
-        cv2.imwrite(str(output_path), image)
+        cv2.imwrite(str(output_path), image, [cv2.IMWRITE_JPEG_QUALITY, _ANNOTATED_JPEG_QUALITY])
     
-    def get_class_names(self) -> Dict[int, str]:
-        """Get dictionary of class ID to class name mappings"""
-        return self.class_names.copy()
+    def get_class_names(self) -> Mapping[int, str]:
+        """Get a read-only mapping of class ID to class name"""
+        return self._class_names_view
 
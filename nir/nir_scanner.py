@@ -2,15 +2,21 @@
 NIR Scanner integration module
 Abstract interface for NIR scanner with mock implementation
 """
+import logging
 import numpy as np
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Tuple
 from config import NIR_ENABLED, NIR_MOCK_MODE, NIR_DEVICE_ID, NIR_API_URL
 
+logger = logging.getLogger(__name__)
+
 
 class NIRScannerBase(ABC):
     """Abstract base class for NIR scanner"""
     
+    # False when NIR is turned off in configuration; fusion then skips NIR entirely
+    enabled = True
+    
     @abstractmethod
     def connect(self) -> bool:
         """Connect to NIR scanner device"""
@@ -34,6 +40,37 @@ class NIRScannerBase(ABC):
         """
         pass
     
+    def scan_batch(self, regions: List[Tuple[int, int, int, int]]) -> List[Dict]:
+        """
+        Perform NIR scans on several regions
+        
+        Scanners that can acquire regions together should override this;
+        the default scans them one at a time.
+        
+        Args:
+            regions: Bounding boxes (x1, y1, x2, y2) to scan
+        
+        Returns:
+            List of scan result dictionaries, one per region, in the same order
+        """
+        return [self.scan(region=region) for region in regions]
+    
+    @staticmethod
+    def to_json(scan_result: Dict) -> Dict:
+        """
+        Convert a scan result into JSON-serializable form
+        
+        Args:
+            scan_result: Dictionary returned by scan() / scan_batch()
+        
+        Returns:
+            Copy of the result with NumPy arrays converted to lists
+        """
+        return {
+            key: value.tolist() if isinstance(value, np.ndarray) else value
+            for key, value in scan_result.items()
+        }
+    
     @abstractmethod
     def get_spectral_data(self) -> np.ndarray:
         """Get raw spectral data from last scan"""
@@ -63,20 +100,28 @@ class MockNIRScanner(NIRScannerBase):
         self.last_scan_result = None
         
         # Simulated spectral bands (typical NIR range: 700-2500 nm)
-        self.spectral_bands = np.linspace(700, 2500, 100)
+        self.spectral_bands = np.linspace(700, 2500, 100, dtype=np.float32)
         
-        print("Mock NIR Scanner initialized (development mode)")
+        # Absorption features are the same for every scan
+        # Ripe fruits often show characteristic absorption features
+        self._absorption_features = np.zeros_like(self.spectral_bands)
+        self._absorption_features[20:30] = -0.1  # Simulate water absorption
+        self._absorption_features[50:60] = -0.15  # Simulate sugar absorption
+        
+        self._rng = np.random.default_rng()
+        
+        logger.info("Mock NIR Scanner initialized (development mode)")
     
     def connect(self) -> bool:
         """Connect to mock NIR scanner"""
         self.connected = True
-        print("Mock NIR Scanner connected")
+        logger.debug("Mock NIR Scanner connected")
         return True
     
     def disconnect(self) -> None:
         """Disconnect from mock NIR scanner"""
         self.connected = False
-        print("Mock NIR Scanner disconnected")
+        logger.debug("Mock NIR Scanner disconnected")
     
     def scan(self, region: Optional[Tuple[int, int, int, int]] = None) -> Dict:
         """
@@ -94,16 +139,11 @@ class MockNIRScanner(NIRScannerBase):
         # Generate mock spectral data
         # Simulate different spectral signatures based on ripeness
         # Fresh/Ripe fruits typically have higher reflectance in certain bands
-        base_reflectance = np.random.uniform(0.3, 0.7, len(self.spectral_bands))
+        spectral_data = self._random_reflectance(len(self.spectral_bands))
         
         # Add some structure to the spectrum (simulate real NIR signatures)
-        # Ripe fruits often show characteristic absorption features
-        absorption_features = np.zeros_like(self.spectral_bands)
-        absorption_features[20:30] = -0.1  # Simulate water absorption
-        absorption_features[50:60] = -0.15  # Simulate sugar absorption
-        
-        spectral_data = base_reflectance + absorption_features
-        spectral_data = np.clip(spectral_data, 0, 1)
+        np.add(spectral_data, self._absorption_features, out=spectral_data)
+        np.clip(spectral_data, 0, 1, out=spectral_data)
         
         self.last_spectral_data = spectral_data
         
@@ -111,14 +151,57 @@ class MockNIRScanner(NIRScannerBase):
         analysis = self.analyze_ripeness(spectral_data)
         
         self.last_scan_result = {
-            'spectral_data': spectral_data.tolist(),
-            'wavelengths': self.spectral_bands.tolist(),
+            'spectral_data': spectral_data,
+            'wavelengths': self.spectral_bands,
             'analysis': analysis,
             'region': region
         }
         
         return self.last_scan_result
     
+    def scan_batch(self, regions: List[Tuple[int, int, int, int]]) -> List[Dict]:
+        """
+        Perform mock NIR scans on several regions at once
+        
+        Args:
+            regions: Bounding boxes (x1, y1, x2, y2) to scan
+        
+        Returns:
+            List of mock scan result dictionaries, one per region, in the same order
+        """
+        if not regions:
+            return []
+        
+        if not self.connected:
+            self.connect()
+        
+        # Generate every region's spectrum in one (regions x bands) array
+        spectra = self._random_reflectance((len(regions), len(self.spectral_bands)))
+        np.add(spectra, self._absorption_features, out=spectra)
+        np.clip(spectra, 0, 1, out=spectra)
+        
+        results = [
+            {
+                'spectral_data': spectral_data,
+                'wavelengths': self.spectral_bands,
+                'analysis': self.analyze_ripeness(spectral_data),
+                'region': region
+            }
+            for region, spectral_data in zip(regions, spectra)
+        ]
+        
+        self.last_spectral_data = spectra[-1]
+        self.last_scan_result = results[-1]
+        
+        return results
+    
+    def _random_reflectance(self, shape) -> np.ndarray:
+        """Draw float32 base reflectance uniformly from [0.3, 0.7)"""
+        reflectance = self._rng.random(shape, dtype=np.float32)
+        reflectance *= 0.4
+        reflectance += 0.3
+        return reflectance
+    
     def get_spectral_data(self) -> np.ndarray:
         """Get raw spectral data from last scan"""
         if self.last_spectral_data is None:
@@ -149,7 +232,7 @@ class MockNIRScanner(NIRScannerBase):
         
         # Simulate ripeness score (0-1 scale)
         # Higher reflectance in certain bands might indicate ripeness
-        ripeness_score = np.random.uniform(0.3, 0.9)
+        ripeness_score = self._rng.uniform(0.3, 0.9)
         
         # Determine ripeness category
         if ripeness_score < 0.4:
@@ -167,7 +250,7 @@ class MockNIRScanner(NIRScannerBase):
         
         # Simulate additional metrics
         sugar_content = ripeness_score * 20  # Mock sugar content (%)
-        moisture_content = np.random.uniform(70, 90)  # Mock moisture (%)
+        moisture_content = self._rng.uniform(70, 90)  # Mock moisture (%)
         
         return {
             'ripeness_score': float(ripeness_score),
@@ -177,7 +260,7 @@ class MockNIRScanner(NIRScannerBase):
             'moisture_content': float(moisture_content),
             'mean_reflectance': float(mean_reflectance),
             'std_reflectance': float(std_reflectance),
-            'confidence': float(np.random.uniform(0.7, 0.95))
+            'confidence': float(self._rng.uniform(0.7, 0.95))
         }
 
 
@@ -201,7 +284,7 @@ class RealNIRScanner(NIRScannerBase):
         # - Connecting to USB/Serial device
         # - Initializing API client
         # - Calibrating scanner
-        print(f"Real NIR Scanner initialized (device_id: {device_id}, api_url: {api_url})")
+        logger.info("Real NIR Scanner initialized (device_id: %s, api_url: %s)", device_id, api_url)
     
     def connect(self) -> bool:
         """Connect to real NIR scanner"""
@@ -214,17 +297,17 @@ class RealNIRScanner(NIRScannerBase):
         try:
             # Placeholder implementation
             self.connected = True
-            print("Real NIR Scanner connected")
+            logger.debug("Real NIR Scanner connected")
             return True
         except Exception as e:
-            print(f"Failed to connect to NIR scanner: {e}")
+            logger.error("Failed to connect to NIR scanner: %s", e)
             return False
     
     def disconnect(self) -> None:
         """Disconnect from real NIR scanner"""
         # TODO: Implement actual disconnection logic
         self.connected = False
-        print("Real NIR Scanner disconnected")
+        logger.debug("Real NIR Scanner disconnected")
     
     def scan(self, region: Optional[Tuple[int, int, int, int]] = None) -> Dict:
         """Perform real NIR scan"""
@@ -264,8 +347,10 @@ def create_nir_scanner() -> NIRScannerBase:
         NIRScannerBase instance (MockNIRScanner or RealNIRScanner)
     """
     if not NIR_ENABLED:
-        print("NIR scanner is disabled in configuration")
-        return MockNIRScanner()  # Return mock even if disabled
+        logger.info("NIR scanner is disabled in configuration")
+        scanner = MockNIRScanner()  # Return mock even if disabled
+        scanner.enabled = False
+        return scanner
     
     if NIR_MOCK_MODE:
         return MockNIRScanner()
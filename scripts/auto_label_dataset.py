@@ -26,82 +26,237 @@ import argparse
 import os
 import random
 import shutil
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Iterator, Sequence
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+IMAGE_EXTS = frozenset({".png", ".jpg", ".jpeg"})
+# copies are I/O-bound, so run several per core
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+MAX_PENDING_COPIES = COPY_WORKERS * 4
+LINK_MODES = ("copy", "hardlink", "reflink", "auto")
+# Linux ioctl that shares a file's data blocks copy-on-write (btrfs, XFS)
+FICLONE = 0x40049409
+# O_BINARY keeps Windows from translating the label's newline
+LABEL_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+
+# directories already created by ensure_dir in this run
+_ensured: set[str] = set()
 
 
 def ensure_dir(path: Path) -> None:
+    key = str(path)
+    if key in _ensured:
+        return
     path.mkdir(parents=True, exist_ok=True)
+    _ensured.add(key)
 
 
-def read_or_create_classes(dst_root: Path) -> list[str]:
-    classes_file = dst_root / "classes.txt"
-    if classes_file.exists():
-        return [line.strip() for line in classes_file.read_text(encoding="utf-8").splitlines() if line.strip()]
-    # create empty file
-    ensure_dir(dst_root)
-    classes_file.write_text("", encoding="utf-8")
-    return []
+# parsed classes.txt per dataset root: class name -> class id
+# class ids are non-blank line positions; the line count is kept for the next new id
+_classes_cache: dict[Path, tuple[dict[str, int], int]] = {}
 
 
-def upsert_class_id(dst_root: Path, class_name: str | None, class_id: int | None) -> int:
+def read_or_create_classes(dst_root: Path, create: bool = True) -> tuple[dict[str, int], int]:
+    key = dst_root.resolve()
+    cached = _classes_cache.get(key)
+    if cached is not None:
+        return cached
+    classes = {}
+    n_lines = 0
+    classes_file = dst_root / "classes.txt"
+    if classes_file.exists():
+        with classes_file.open(encoding="utf-8") as f:
+            names = (line.strip() for line in f)
+            for n_lines, name in enumerate(filter(None, names), 1):
+                # a repeated name keeps the id of its first line, as list.index() did
+                classes.setdefault(name, n_lines - 1)
+    elif create:
+        # create empty file
+        ensure_dir(dst_root)
+        classes_file.write_text("", encoding="utf-8")
+    _classes_cache[key] = (classes, n_lines)
+    return classes, n_lines
+
+
+def upsert_class_id(dst_root: Path, class_name: str | None, class_id: int | None, dry_run: bool = False) -> int:
     if class_id is not None:
         return class_id
     if not class_name:
         raise ValueError("Provide --class-name or --class-id")
-    classes = read_or_create_classes(dst_root)
+    classes, n_lines = read_or_create_classes(dst_root, create=not dry_run)
     if class_name not in classes:
-        classes.append(class_name)
-        (dst_root / "classes.txt").write_text("\n".join(classes) + "\n", encoding="utf-8")
-    return classes.index(class_name)
-
-
-def gather_images(src_dir: Path) -> list[Path]:
+        new_id = n_lines
+        if dry_run:
+            return new_id
+        with (dst_root / "classes.txt").open("a+b") as f:
+            # start on a fresh line if the file's last line has no newline
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write(class_name.encode("utf-8") + b"\n")
+        classes[class_name] = new_id
+        _classes_cache[dst_root.resolve()] = (classes, n_lines + 1)
+        return new_id
+    return classes[class_name]
+
+
+def gather_images(src_dir: Path) -> Iterator[str]:
     if not src_dir.exists():
         raise FileNotFoundError(f"Source directory not found: {src_dir}")
-    images = [p for p in src_dir.rglob("*") if p.suffix.lower() in IMAGE_EXTS and p.is_file()]
-    return images
-
-
-def unique_target_path(target_dir: Path, base_name: str, ext: str) -> Path:
-    candidate = target_dir / f"{base_name}{ext}"
-    if not candidate.exists():
-        return candidate
+    # walk with os.scandir so type checks use the cached directory entry instead of a stat() per file
+    stack = [str(src_dir)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                name = entry.name
+                if name[name.rfind("."):].lower() in IMAGE_EXTS and entry.is_file():
+                    yield entry.path
+
+
+def unique_target_stem(taken: set[str], base_name: str, ext: str) -> str:
+    # taken holds normcased names so case-insensitive filesystems still see collisions
+    stem = base_name
     # avoid collisions by suffixing _1, _2, ...
     i = 1
-    while True:
-        c = target_dir / f"{base_name}_{i}{ext}"
-        if not c.exists():
-            return c
+    while os.path.normcase(stem + ext) in taken:
+        stem = f"{base_name}_{i}"
         i += 1
+    taken.add(os.path.normcase(stem + ext))
+    return stem
 
 
-def write_label(label_path: Path, class_id: int, bbox: tuple[float, float, float, float]) -> None:
+def label_bytes(class_id: int, bbox: tuple[float, float, float, float]) -> bytes:
     cx, cy, w, h = bbox
-    label_path.write_text(f"{class_id} {cx} {cy} {w} {h}\n", encoding="ascii")
+    return f"{class_id} {cx} {cy} {w} {h}\n".encode("ascii")
+
+
+def write_label(label_path: str, label: bytes) -> None:
+    # a label is a few bytes, so write through the raw fd instead of building a buffered file object
+    fd = os.open(label_path, LABEL_OPEN_FLAGS, 0o644)
+    try:
+        os.write(fd, label)
+    finally:
+        os.close(fd)
 
 
-def copy_and_label(images: list[Path], dst_img: Path, dst_lbl: Path, class_id: int, bbox: tuple[float, float, float, float]) -> int:
+def reflink_file(src: str, dst: str) -> None:
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def fast_copy(src: str, dst: str) -> None:
+    if not sys.platform.startswith("linux"):  # no file-to-file sendfile / fadvise
+        shutil.copyfile(src, dst)
+        return
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        # each source is read once, front to back: read ahead, then drop it from the page cache
+        os.posix_fadvise(s.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        # copy in the kernel with sendfile, as shutil.copyfile does, on the descriptor carrying the hint
+        size = os.fstat(s.fileno()).st_size
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(d.fileno(), s.fileno(), offset, size - offset)
+            if sent == 0:  # source shrank while copying
+                break
+            offset += sent
+        os.posix_fadvise(s.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def place_image(src: str, dst: str, link_mode: str) -> str:
+    # returns the mode that actually worked so callers can skip doomed attempts
+    if link_mode in ("reflink", "auto") and fcntl is not None:
+        try:
+            reflink_file(src, dst)
+            return "reflink"
+        except OSError:
+            if os.path.exists(dst):
+                os.unlink(dst)
+    if link_mode in ("hardlink", "auto"):
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:  # e.g. src and dst on different filesystems
+            pass
+    fast_copy(src, dst)
+    return "copy"
+
+
+def copy_and_label(images: list[str], indices: Sequence[int], dst_img: Path, dst_lbl: Path, class_id: int,
+                   bbox: tuple[float, float, float, float], link_mode: str = "copy", dry_run: bool = False) -> int:
+    if dry_run:
+        # preview only: count what would be copied without touching the destination
+        return len(indices)
     ensure_dir(dst_img)
     ensure_dir(dst_lbl)
+    # every label in a run is identical, so format it once
+    label = label_bytes(class_id, bbox)
+    # one directory listing replaces an exists() probe per candidate name
+    dst_img, dst_lbl = str(dst_img), str(dst_lbl)
+    with os.scandir(dst_img) as it:
+        taken = {os.path.normcase(entry.name) for entry in it}
+
+    def copy_one(src: str, tgt_img: str, tgt_lbl: str, mode: str) -> str:
+        mode = place_image(src, tgt_img, mode)
+        write_label(tgt_lbl, label)
+        return mode
+
     count = 0
-    for src in images:
-        base = src.stem
-        tgt_img = unique_target_path(dst_img, base, src.suffix)
-        shutil.copy2(src, tgt_img)
-        tgt_lbl = dst_lbl / (tgt_img.stem + ".txt")
-        write_label(tgt_lbl, class_id, bbox)
-        count += 1
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+        pending = set()
+        for i in indices:
+            src = images[i]
+            # target names are resolved here, in order, so collision suffixes don't depend on thread timing
+            name = os.path.basename(src)
+            dot = name.rfind(".")  # gather_images only yields names with an image extension
+            stem = unique_target_stem(taken, name[:dot], name[dot:])
+            tgt_img = os.path.join(dst_img, stem + name[dot:])
+            tgt_lbl = os.path.join(dst_lbl, stem + ".txt")
+            if count == 0:
+                # the first image settles which link mode this filesystem pair supports
+                link_mode = copy_one(src, tgt_img, tgt_lbl, link_mode)
+            else:
+                pending.add(pool.submit(copy_one, src, tgt_img, tgt_lbl, link_mode))
+            count += 1
+            # copies start while later targets are still being resolved; bound the queue so
+            # a huge split never holds every pending copy in memory
+            if len(pending) >= MAX_PENDING_COPIES:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()  # re-raises a copy error
+        for future in pending:
+            future.result()
     return count
 
 
-def split_indices(n: int, ratios: tuple[float, float, float]) -> tuple[list[int], list[int], list[int]]:
+def total_size(images: list[str], indices: Sequence[int]) -> int:
+    return sum(os.stat(images[i]).st_size for i in indices)
+
+
+def split_indices(n: int, ratios: tuple[float, float, float], seed: int) -> tuple[Sequence[int], Sequence[int], Sequence[int]]:
     r_train, r_val, r_test = ratios
     assert abs((r_train + r_val + r_test) - 1.0) < 1e-6, "Split ratios must sum to 1"
-    idxs = list(range(n))
-    random.shuffle(idxs)
+    if np is not None:
+        idxs = np.random.default_rng(seed).permutation(n)
+    else:
+        idxs = random.Random(seed).sample(range(n), n)
     n_train = int(n * r_train)
     n_val = int(n * r_val)
     train_idx = idxs[:n_train]
@@ -119,19 +274,22 @@ def main() -> None:
     parser.add_argument("--mode", choices=["split", "flat"], default="split", help="split: train/val/test; flat: images/labels only")
     parser.add_argument("--split", nargs=3, type=float, default=[0.8, 0.1, 0.1], metavar=("TRAIN", "VAL", "TEST"), help="Split ratios for split mode")
     parser.add_argument("--bbox", nargs=4, type=float, default=[0.5, 0.5, 0.8, 0.9], metavar=("CX", "CY", "W", "H"), help="Placeholder bbox (normalized)")
+    parser.add_argument("--link-mode", choices=LINK_MODES, default="copy",
+                        help="How to place images: hardlink/reflink share the source data on the same filesystem "
+                             "(falling back to copy), auto tries reflink then hardlink then copy")
+    parser.add_argument("--dry-run", action="store_true", help="Print per-split counts and total size without copying anything")
     parser.add_argument("--seed", type=int, default=42, help="Random seed for splitting")
     args = parser.parse_args()
 
-    random.seed(args.seed)
     dst_root = Path(args.dst)
     src_dir = Path(args.src)
     bbox = (args.bbox[0], args.bbox[1], args.bbox[2], args.bbox[3])
 
     # Determine/insert class id
-    class_id = upsert_class_id(dst_root, args.class_name, args.class_id)
+    class_id = upsert_class_id(dst_root, args.class_name, args.class_id, args.dry_run)
 
     # Gather images
-    images = gather_images(src_dir)
+    images = list(gather_images(src_dir))
     if not images:
         print(f"No images found under: {src_dir}")
         return
@@ -139,19 +297,36 @@ def main() -> None:
     if args.mode == "flat":
         dst_images = dst_root / "images"
         dst_labels = dst_root / "labels"
-        copied = copy_and_label(images, dst_images, dst_labels, class_id, bbox)
+        all_idx = range(len(images))
+        copied = copy_and_label(images, all_idx, dst_images, dst_labels, class_id, bbox, args.link_mode, args.dry_run)
+        if args.dry_run:
+            print(f"Dry run (class id {class_id}) -> images: {copied}, size: {total_size(images, all_idx) / 1e6:.1f} MB")
+            return
         print(f"Flat copy complete -> images: {copied}, labels: {copied}")
         return
 
     # split mode
-    train_idx, val_idx, test_idx = split_indices(len(images), tuple(args.split))
-    train_imgs = [images[i] for i in train_idx]
-    val_imgs = [images[i] for i in val_idx]
-    test_imgs = [images[i] for i in test_idx]
-
-    t1 = copy_and_label(train_imgs, dst_root / "train" / "images", dst_root / "train" / "labels", class_id, bbox)
-    t2 = copy_and_label(val_imgs,   dst_root / "val" / "images",   dst_root / "val" / "labels",   class_id, bbox)
-    t3 = copy_and_label(test_imgs,  dst_root / "test" / "images",  dst_root / "test" / "labels",  class_id, bbox)
+    train_idx, val_idx, test_idx = split_indices(len(images), tuple(args.split), args.seed)
+    splits = (("train", train_idx), ("val", val_idx), ("test", test_idx))
+    # hand each worker only its own split's paths rather than pickling the full list three times
+    jobs = [([images[i] for i in idx], dst_root / split / "images", dst_root / split / "labels") for split, idx in splits]
+
+    if args.dry_run:
+        t1, t2, t3 = (len(split_images) for split_images, _, _ in jobs)
+        print(f"Dry run (class id {class_id}), nothing copied:")
+        print(f"  Train: {t1}")
+        print(f"  Val:   {t2}")
+        print(f"  Test:  {t3}")
+        print(f"  Size:  {total_size(images, range(len(images))) / 1e6:.1f} MB")
+        return
+
+    # the splits share no files, so copy each one in its own process
+    with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [
+            pool.submit(copy_and_label, split_images, range(len(split_images)), img_dir, lbl_dir, class_id, bbox, args.link_mode)
+            for split_images, img_dir, lbl_dir in jobs
+        ]
+        t1, t2, t3 = (future.result() for future in futures)
 
     print("Split copy complete:")
     print(f"  Train: {t1}")
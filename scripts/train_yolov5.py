@@ -4,8 +4,6 @@ Trains YOLOv5n model on 15-class fruit ripeness dataset using Ultralytics.
 Supports pause/resume functionality - press Ctrl+C to pause, then resume later.
 """
 
-from ultralytics import YOLO
-import torch
 import signal
 import sys
 import os
@@ -52,12 +50,12 @@ def find_latest_checkpoint():
     if last_pt.exists():
         return str(last_pt)
     
-    # Otherwise, find the most recent checkpoint
-    checkpoints = list(checkpoint_dir.glob('*.pt'))
+    # Otherwise, find the most recent checkpoint by modification time
+    with os.scandir(checkpoint_dir) as it:
+        checkpoints = [(entry.stat().st_mtime, entry.path) for entry in it
+                       if entry.name.endswith('.pt') and entry.is_file()]
     if checkpoints:
-        # Sort by modification time, most recent first
-        checkpoints.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-        return str(checkpoints[0])
+        return max(checkpoints)[1]
     
     return None
 
@@ -76,6 +74,10 @@ def main():
     
     args = parser.parse_args()
     
+    # Heavy imports deferred until after argument parsing so --help and bad arguments return immediately
+    from ultralytics import YOLO
+    import torch
+    
     # Register signal handler for graceful pause
     signal.signal(signal.SIGINT, signal_handler)
     
@@ -112,8 +114,11 @@ def main():
                 print("Starting fresh training.")
                 resume_path = None
     
+    # Both branches above keep resume_path only for a checkpoint that exists, so no further exists() checks are needed
+    resume_exists = resume_path is not None
+    
     # Load model
-    if resume_path and os.path.exists(resume_path):
+    if resume_exists:
         print(f"\nLoading model from checkpoint: {resume_path}")
         model = YOLO(resume_path)
     else:
@@ -166,7 +171,7 @@ def main():
         # Add resume parameter if resuming from checkpoint
         # Note: When loading from checkpoint, Ultralytics will automatically resume
         # but we can also explicitly set resume=True to ensure proper resumption
-        if resume_path and os.path.exists(resume_path):
+        if resume_exists:
             train_args['resume'] = True
         
         results = model.train(**train_args)